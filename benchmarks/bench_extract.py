@@ -0,0 +1,54 @@
+"""
+Free-text extraction throughput
+
+Runs extract.extract_batch over synthetic listings that carry price,
+bedrooms and surface only in their title/description, and reports
+descriptions per minute on one core (target: 100k/min).
+
+    python benchmarks/bench_extract.py [--items 100000] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from extract import extract_batch  # noqa: E402
+
+CITIES = ["Tunis", "La Marsa", "Sousse", "Sfax", "Nabeul", "Hammamet", "Ariana", "Bizerte"]
+PRICES = ["{:,} DT", "{} mille", "{:,} dinars", "prix: {}", "{}€"]
+TARGET_PER_MINUTE = 100_000
+
+
+def make_docs(n: int):
+    rng = random.Random(7)
+    docs = []
+    for _ in range(n):
+        price = rng.choice(PRICES).format(rng.randint(300, 900_000)).replace(",", ".")
+        docs.append({
+            "title": f"A louer appartement S+{rng.randint(1, 4)} {rng.choice(CITIES)}",
+            "description": (f"Bel appartement de {rng.randint(40, 250)} m² au {rng.randint(1, 8)}e etage, "
+                            f"cuisine equipee, proche commodites. Prix {price}, a debattre. " * 2),
+        })
+    return docs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        docs = make_docs(args.items)
+        start = time.perf_counter()
+        extract_batch(docs)
+        best = min(best, time.perf_counter() - start)
+    filled = sum(1 for d in docs if d.get("price") is not None and d.get("bedrooms") is not None and d.get("surface_m2") is not None)
+    per_minute = args.items / best * 60
+    print(f"extract_batch  {best * 1000:8.1f} ms  {per_minute:12,.0f} descriptions/min  "
+          f"({per_minute / TARGET_PER_MINUTE:.1f}x target)  all fields filled: {filled / args.items:.1%}")
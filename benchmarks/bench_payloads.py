@@ -0,0 +1,63 @@
+"""
+Ingest body encodings
+
+Bytes on the wire and decode CPU (decompress + parse) per batch of 10k
+listings for each body encoding accepted by /ingest. Encodings whose
+optional package (zstandard, msgpack, orjson) is missing are skipped.
+
+    python benchmarks/bench_payloads.py [--items 10000] [--repeat 5]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_validation import make_items  # noqa: E402
+from payloads import zstandard, msgpack, orjson  # noqa: E402
+
+
+def encodings(payload):
+    raw_json = json.dumps(payload).encode()
+    yield "json", raw_json, json.loads
+    if orjson is not None:
+        yield "json (orjson)", raw_json, orjson.loads
+    yield "json+gzip", gzip.compress(raw_json, 6), lambda b: json.loads(zlib.decompress(b, 47))
+    if orjson is not None:
+        yield "json+gzip (orjson)", gzip.compress(raw_json, 6), lambda b: orjson.loads(zlib.decompress(b, 47))
+    if zstandard is not None:
+        zstd_json = zstandard.ZstdCompressor(level=3).compress(raw_json)
+        yield "json+zstd", zstd_json, lambda b: json.loads(zstandard.ZstdDecompressor().decompress(b))
+        if orjson is not None:
+            yield "json+zstd (orjson)", zstd_json, lambda b: orjson.loads(zstandard.ZstdDecompressor().decompress(b))
+    if msgpack is not None:
+        packed = msgpack.packb(payload)
+        yield "msgpack", packed, lambda b: msgpack.unpackb(b, raw=False)
+        yield "msgpack+gzip", gzip.compress(packed, 6), lambda b: msgpack.unpackb(zlib.decompress(b, 47), raw=False)
+        if zstandard is not None:
+            yield "msgpack+zstd", zstandard.ZstdCompressor(level=3).compress(packed), \
+                lambda b: msgpack.unpackb(zstandard.ZstdDecompressor().decompress(b), raw=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = {"items": make_items(args.items)}
+    print(f"{'encoding':<22} {'bytes':>12} {'ratio':>7} {'decode ms':>10}")
+    baseline = None
+    for name, body, decode in encodings(payload):
+        baseline = baseline or len(body)
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.process_time()
+            decode(body)
+            best = min(best, time.process_time() - start)
+        print(f"{name:<22} {len(body):>12} {len(body) / baseline:>7.2f} {best * 1000:>10.1f}")
@@ -0,0 +1,77 @@
+"""
+Batch validation throughput
+
+Compares per-item Listing.model_validate against the compiled List[Listing]
+adapter used by ingest.validate_items, on 10k synthetic scraper items
+(1% invalid).
+
+    python benchmarks/bench_validation.py [--items 10000] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from schemas import Listing  # noqa: E402
+from ingest import validate_items, listing_document  # noqa: E402
+
+CITIES = ["Tunis", "La Marsa", "Sousse", "Sfax", "Nabeul", "Hammamet", "Ariana", "Bizerte"]
+
+
+def make_items(n: int):
+    rng = random.Random(42)
+    items = []
+    for i in range(n):
+        item = {
+            "title": f"Appartement S+{rng.randint(1, 4)} {rng.choice(CITIES)}",
+            "description": "Bel appartement lumineux, cuisine equipee, proche commodites. " * 3,
+            "price": rng.randint(300, 5000),
+            "currency": "TND",
+            "city": rng.choice(CITIES),
+            "bedrooms": rng.randint(1, 4),
+            "surface_m2": rng.randint(40, 250),
+            "deal_type": rng.choice(["rent", "sale"]),
+            "property_type": "apartment",
+            "url": f"https://www.tayara.tn/item/{i:08x}/appartement/",
+            "images": [f"https://cdn.tayara.tn/{i}/{j}.jpg" for j in range(3)],
+            "posted_at": "2024-05-01T10:00:00",
+        }
+        if i % 100 == 0:
+            item["price"] = -1
+        items.append(item)
+    return items
+
+
+def per_item(items, source):
+    valid, invalid = [], []
+    for i, item in enumerate(items):
+        try:
+            valid.append((i, listing_document(Listing.model_validate({**item, "source": source}), exclude_unset=True)))
+        except Exception as e:
+            invalid.append({"index": i, "errors": str(e)})
+    return valid, invalid
+
+
+def bench(fn, items, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(items, "tayara")
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    items = make_items(args.items)
+    for name, fn in (("per-item model_validate", per_item), ("batch TypeAdapter", validate_items)):
+        seconds = bench(fn, items, args.repeat)
+        print(f"{name:<26} {seconds * 1000:8.1f} ms  {args.items / seconds:10.0f} items/s")
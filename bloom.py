@@ -0,0 +1,94 @@
+"""
+Seen Dedup Keys
+
+Per-process Bloom filter over listing dedup keys. Ingest uses it to split
+a batch into definitely-new keys (no lookup needed) and maybe-existing
+keys (looked up together with their content fingerprints). A false
+positive only costs a lookup; a stale negative (a key written by another
+worker) is still handled by the upsert itself.
+"""
+
+import math
+import os
+import threading
+from typing import Iterable, Dict, Any
+
+from database import iter_documents
+
+CAPACITY = int(os.getenv("DEDUP_BLOOM_CAPACITY", 2_000_000))
+FP_RATE = float(os.getenv("DEDUP_BLOOM_FP_RATE", 0.01))
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.num_bits = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _positions(self, key: bytes):
+        # keys are already uniform digests: double hashing over two 64-bit halves
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, key: bytes):
+        with self._lock:
+            new = False
+            for pos in self._positions(key):
+                byte, mask = pos >> 3, 1 << (pos & 7)
+                if not self.bits[byte] & mask:
+                    self.bits[byte] |= mask
+                    new = True
+            if new:
+                self.count += 1
+
+    def update(self, keys: Iterable[bytes]):
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def stats(self) -> Dict[str, Any]:
+        fill = 1 - math.exp(-self.num_hashes * self.count / self.num_bits)
+        return {
+            "capacity": self.capacity,
+            "count": self.count,
+            "num_bits": self.num_bits,
+            "num_hashes": self.num_hashes,
+            "memory_bytes": len(self.bits),
+            "target_fp_rate": self.fp_rate,
+            "estimated_fp_rate": round(fill ** self.num_hashes, 6),
+        }
+
+
+seen_keys = BloomFilter(CAPACITY, FP_RATE)
+_ready = threading.Event()
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def maybe_exists(key: bytes) -> bool:
+    """False only when the key has certainly never been written (filter warmed)"""
+    return not _ready.is_set() or key in seen_keys
+
+
+def warm():
+    """Load every binary dedup key from the listing collection"""
+    for doc in iter_documents("listing", {"dedup_key": {"$type": "binData"}}, {"_id": 0, "dedup_key": 1}, batch_size=10000):
+        seen_keys.add(doc["dedup_key"])
+    _ready.set()
+
+
+def warm_in_background():
+    threading.Thread(target=warm, name="dedup-bloom-warm", daemon=True).start()
+
+
+def stats() -> Dict[str, Any]:
+    return {"ready": is_ready(), **seen_keys.stats()}
@@ -0,0 +1,164 @@
+"""
+Bulk Loader for JSONL Listing Dumps
+
+Streams a JSONL file (one listing per line), cuts it into fixed-size
+chunks and hands them to worker processes that validate against
+schemas.Listing, build dedup keys and bulk upsert through the regular
+ingest write path. Completed chunks are appended to a checkpoint file, so
+a killed load resumes where it stopped.
+
+    python bulk_load.py dump.jsonl --source tayara [--workers 4] [--chunk-size 1000]
+
+Items carrying their own `source` keep it; --source is the fallback.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import List, Dict, Any, Iterator, Tuple, Optional
+
+STATUSES = ("created", "updated", "unchanged", "failed", "invalid")
+
+
+def load_chunk(offset: int, lines: List[bytes], default_source: Optional[str]) -> Tuple[int, Dict[str, int]]:
+    """Worker: parse, validate and write one chunk. Returns (offset, counts)."""
+    from ingest import SOURCES, ingest_batch
+    from payloads import loads_json
+
+    counts = Counter()
+    by_source: Dict[str, List[Dict[str, Any]]] = {}
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = loads_json(line)
+        except ValueError:
+            counts["invalid"] += 1
+            continue
+        source = item.get('source', default_source) if isinstance(item, dict) else None
+        if source not in SOURCES:
+            counts["invalid"] += 1
+            continue
+        by_source.setdefault(source, []).append(item)
+
+    for source, items in by_source.items():
+        # a dead database should stop the load (and resume later), not fill a local spool
+        result = ingest_batch(items, source, spool_on_outage=False)
+        for status in result["statuses"]:
+            counts[status] += 1
+    return offset, dict(counts)
+
+
+def read_chunks(path: str, chunk_size: int) -> Iterator[Tuple[int, List[bytes]]]:
+    """Yield (byte offset, lines) chunks of the file"""
+    with open(path, "rb") as f:
+        offset, lines = 0, []
+        position = 0
+        for line in f:
+            if not lines:
+                offset = position
+            lines.append(line)
+            position += len(line)
+            if len(lines) >= chunk_size:
+                yield offset, lines
+                lines = []
+        if lines:
+            yield offset, lines
+
+
+def read_checkpoint(path: str, chunk_size: int) -> set:
+    """Offsets of chunks already loaded. The first line records the chunk size."""
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        header = f.readline().strip()
+        if header != f"chunk_size={chunk_size}":
+            sys.exit(f"{path} was written with {header or 'an unknown chunk size'}; "
+                     f"rerun with the same --chunk-size or --restart")
+        return {int(line) for line in f if line.strip()}
+
+
+def run(path: str, source: Optional[str], workers: int, chunk_size: int, checkpoint: str, restart: bool) -> Dict[str, Any]:
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    done = read_checkpoint(checkpoint, chunk_size)
+    new_checkpoint = not os.path.exists(checkpoint)
+
+    totals = Counter()
+    lines_done = 0
+    skipped = 0
+    start = time.monotonic()
+    total_bytes = os.path.getsize(path)
+
+    # spawn: every worker opens its own MongoClient on import
+    ctx = multiprocessing.get_context("spawn")
+    with open(checkpoint, "a") as ck, ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        if new_checkpoint:
+            ck.write(f"chunk_size={chunk_size}\n")
+            ck.flush()
+        in_flight: Dict[Any, Tuple[int, int]] = {}
+        last_offset = 0
+
+        def drain(return_when):
+            nonlocal lines_done
+            finished, _ = wait(list(in_flight), return_when=return_when)
+            for future in finished:
+                offset, count = future.result()
+                _, n_lines = in_flight.pop(future)
+                totals.update(count)
+                lines_done += n_lines
+                ck.write(f"{offset}\n")
+                ck.flush()
+            elapsed = time.monotonic() - start
+            print(f"\r{last_offset / max(total_bytes, 1):6.1%}  {lines_done} lines  "
+                  f"{lines_done / max(elapsed, 1e-9):,.0f} lines/s  "
+                  + "  ".join(f"{k}={totals[k]}" for k in STATUSES),
+                  end="", file=sys.stderr, flush=True)
+
+        for offset, lines in read_chunks(path, chunk_size):
+            last_offset = offset
+            if offset in done:
+                skipped += 1
+                continue
+            in_flight[pool.submit(load_chunk, offset, lines, source)] = (offset, len(lines))
+            # bound memory: at most two chunks queued per worker
+            if len(in_flight) >= workers * 2:
+                drain(FIRST_COMPLETED)
+        last_offset = total_bytes
+        while in_flight:
+            drain(FIRST_COMPLETED)
+    print(file=sys.stderr)
+
+    elapsed = time.monotonic() - start
+    return {
+        "lines": lines_done,
+        "skipped_chunks": skipped,
+        "seconds": round(elapsed, 2),
+        "lines_per_second": round(lines_done / elapsed, 1) if elapsed else None,
+        **{k: totals[k] for k in STATUSES},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel bulk load of JSONL listing dumps")
+    parser.add_argument("path", help="JSONL file, one listing per line")
+    parser.add_argument("--source", help="Source for items without one (facebook, tayara, tunisie-annonces, other)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <path>.checkpoint)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and load everything")
+    args = parser.parse_args()
+
+    print(run(
+        args.path,
+        args.source,
+        workers=max(1, args.workers),
+        chunk_size=max(1, args.chunk_size),
+        checkpoint=args.checkpoint or f"{args.path}.checkpoint",
+        restart=args.restart,
+    ))
@@ -5,17 +5,24 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, BulkWriteError
+import bson
 from bson import ObjectId
+from bson.errors import InvalidDocument
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
-from typing import Union, List, Dict, Any
+from typing import Union, List, Dict, Any, NamedTuple, Optional
 from pydantic import BaseModel
 
 # Load environment variables from .env file
 load_dotenv()
 
+
+class DatabaseUnavailable(Exception):
+    """Raised when DATABASE_URL / DATABASE_NAME are not configured"""
+
 _client = None
 db = None
 
@@ -30,7 +37,7 @@ if database_url and database_name:
 def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+        raise DatabaseUnavailable("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
     data_dict = data.model_dump() if isinstance(data, BaseModel) else dict(data)
 
@@ -42,31 +49,221 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     return str(result.inserted_id)
 
 
-def upsert_document(collection_name: str, filter_dict: Dict[str, Any], data: Dict[str, Any]):
-    """Upsert a document by filter with timestamps. Returns id and upserted flag."""
+CREATED, UPDATED, UNCHANGED, FAILED = "created", "updated", "unchanged", "failed"
+# server BSON limit, less room for the update operators and timestamps around a document
+MAX_DOCUMENT_BYTES = 16 * 1024 * 1024 - 16 * 1024
+
+
+class UpsertResult(NamedTuple):
+    id: Optional[str]
+    status: str
+    error: Optional[str] = None
+    previous: Any = None   # old value of the tracked field when an update changed it
+
+
+def _change(old: Any, new: Any, now: datetime) -> Optional[Dict[str, Any]]:
+    """Denormalized last-change record for a tracked field, None when nothing changed"""
+    if old is None or new is None or old == new:
+        return None
+    change = {"old": old, "new": new, "at": now}
+    if isinstance(old, (int, float)) and isinstance(new, (int, float)):
+        change["delta"] = new - old
+    return change
+
+
+def _literal(value: Any) -> Dict[str, Any]:
+    return {"$literal": value}
+
+
+def _same_time(stored: Any, now: datetime) -> bool:
+    # BSON dates have millisecond precision and come back naive (UTC)
+    return isinstance(stored, datetime) and stored.replace(tzinfo=timezone.utc) == now
+
+
+def upsert_document(collection_name: str, filter_dict: Dict[str, Any], data: Dict[str, Any], fingerprint_field: str = None, track_field: str = None):
+    """Upsert a document by filter with timestamps. Returns an UpsertResult (id, created/updated/unchanged status).
+
+    Uses a single find-and-modify with a pipeline update; the timestamps of
+    the returned document tell whether it was created, updated or left alone.
+    With `fingerprint_field`, a document whose stored fingerprint equals
+    data[fingerprint_field] keeps every field as it was (decided inside the
+    update, so it does not depend on any index) and is reported unchanged.
+    With `track_field`, an update that changes that field also sets
+    `last_<track_field>_change` ({old, new, at, delta}) in the same write and
+    reports the old value in UpsertResult.previous.
+    """
     if db is None:
-        raise Exception("Database not available. Check env vars.")
+        raise DatabaseUnavailable("Database not available. Check env vars.")
 
     now = datetime.now(timezone.utc)
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
     data = dict(data)
     data['updated_at'] = now
-    set_on_insert = {'created_at': now}
 
-    result = db[collection_name].update_one(filter_dict, {"$set": data, "$setOnInsert": set_on_insert}, upsert=True)
+    # stage 1 reads the stored document into temporary flags, stage 2 writes
+    flags: Dict[str, Any] = {}
+    fields: Dict[str, Any] = {f: _literal(v) for f, v in data.items()}
+    if fingerprint_field:
+        flags["__unchanged"] = {"$eq": ["$" + fingerprint_field, _literal(data.get(fingerprint_field))]}
+        fields = {f: {"$cond": ["$__unchanged", "$" + f, v]} for f, v in fields.items()}
+    new = data.get(track_field) if track_field else None
+    change_field = f"last_{track_field}_change" if track_field else None
+    if new is not None:
+        old = "$" + track_field
+        change: Dict[str, Any] = {"old": old, "new": _literal(new), "at": now}
+        if isinstance(new, (int, float)):
+            change["delta"] = {"$cond": [{"$isNumber": old}, {"$subtract": [_literal(new), old]}, "$$REMOVE"]}
+        changed = [{"$ne": [{"$ifNull": [old, None]}, None]}, {"$ne": [old, _literal(new)]}]
+        if fingerprint_field:
+            changed.append({"$ne": ["$" + fingerprint_field, _literal(data.get(fingerprint_field))]})
+        flags["__change"] = {"$cond": [{"$and": changed}, change, "$" + change_field]}
+        fields[change_field] = "$__change"
+    fields['created_at'] = {"$ifNull": ["$created_at", now]}
+    pipeline = [{"$set": flags}, {"$set": fields}, {"$project": {f: 0 for f in flags}}] if flags else [{"$set": fields}]
+
+    projection = {"_id": 1, "created_at": 1, "updated_at": 1}
+    if change_field:
+        projection[change_field] = 1
+    for attempt in range(2):
+        try:
+            after = db[collection_name].find_one_and_update(
+                filter_dict,
+                pipeline,
+                projection=projection,
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            break
+        except DuplicateKeyError:
+            # a concurrent upsert inserted the same key first; the retry updates it
+            if attempt:
+                raise
+    _id = str(after["_id"])
+    if _same_time(after.get("created_at"), now):
+        return UpsertResult(_id, CREATED)
+    if not _same_time(after.get("updated_at"), now):
+        return UpsertResult(_id, UNCHANGED)
+    change = after.get(change_field) if change_field else None
+    if isinstance(change, dict) and _same_time(change.get("at"), now):
+        return UpsertResult(_id, UPDATED, previous=change.get("old"))
+    return UpsertResult(_id, UPDATED)
 
-    if result.upserted_id is not None:
-        return str(result.upserted_id), True
-    # fetch existing id
-    existing = db[collection_name].find_one(filter_dict, {"_id": 1})
-    return str(existing["_id"]) if existing else None, False
 
+def _encoding_error(doc: Dict[str, Any]) -> Optional[str]:
+    # pymongo raises these client-side for the whole bulk_write, after earlier sub-batches were sent
+    try:
+        size = len(bson.encode(doc))
+    except (InvalidDocument, TypeError, OverflowError) as e:
+        return f"cannot encode document: {e}"
+    if size > MAX_DOCUMENT_BYTES:
+        return f"document too large: {size} bytes (max {MAX_DOCUMENT_BYTES})"
+    return None
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, sort: List = None):
+
+def bulk_upsert_documents(collection_name: str, key_field: str, docs: List[Dict[str, Any]], batch_size: int = 1000, fingerprint_field: str = None, new_keys: set = None, track_field: str = None):
+    """Upsert many documents keyed by `key_field` with unordered bulk writes.
+    Returns a list of UpsertResult aligned with `docs`.
+
+    Existing documents are looked up with one query per batch, so ids are known
+    up front and, with `fingerprint_field`, unchanged documents are skipped.
+    Keys in `new_keys` are known not to exist yet and are left out of the lookup.
+    A write error only fails its own documents (status "failed" with the
+    server's message); the rest of the batch is still applied. Documents that
+    cannot be encoded or exceed MAX_DOCUMENT_BYTES fail before anything is sent.
+    With `track_field`, updates that change that field set
+    `last_<track_field>_change` in the same write (the old value comes from
+    the lookup) and report the old value in UpsertResult.previous.
+    """
+    if db is None:
+        raise DatabaseUnavailable("Database not available. Check env vars.")
+
+    collection = db[collection_name]
+    results = []
+    for start in range(0, len(docs), batch_size):
+        batch = docs[start:start + batch_size]
+        now = datetime.now(timezone.utc)
+
+        projection = {key_field: 1}
+        for field in (fingerprint_field, track_field):
+            if field:
+                projection[field] = 1
+        lookup = list({doc[key_field] for doc in batch if not new_keys or doc[key_field] not in new_keys})
+        existing = {}
+        if lookup:
+            existing = {found[key_field]: found for found in collection.find({key_field: {"$in": lookup}}, projection)}
+
+        # one write per key; repeated keys within the batch are merged, last value wins
+        writes: Dict[Any, Dict[str, Any]] = {}
+        outcomes: List[UpsertResult] = []
+        for doc in batch:
+            key = doc[key_field]
+            found = existing.get(key)
+            if key in writes:
+                writes[key]["set"].update(doc)
+                writes[key]["indexes"].append(len(outcomes))
+                outcomes.append(UpsertResult(outcomes[writes[key]["indexes"][0]].id, UPDATED))
+                continue
+            if found is not None and fingerprint_field and found.get(fingerprint_field) == doc.get(fingerprint_field):
+                outcomes.append(UpsertResult(str(found["_id"]), UNCHANGED))
+                continue
+            error = _encoding_error(doc)
+            if error is not None:
+                outcomes.append(UpsertResult(None, FAILED, error))
+                continue
+            if found is not None:
+                writes[key] = {"set": dict(doc), "insert_id": None, "indexes": [len(outcomes)], "found": found}
+                outcomes.append(UpsertResult(str(found["_id"]), UPDATED))
+            else:
+                new_id = ObjectId()
+                writes[key] = {"set": dict(doc), "insert_id": new_id, "indexes": [len(outcomes)]}
+                outcomes.append(UpsertResult(str(new_id), CREATED))
+
+        if writes:
+            ops = []
+            for key, w in writes.items():
+                w["set"]['updated_at'] = now
+                if track_field and w["insert_id"] is None and track_field in w["set"]:
+                    change = _change(w["found"].get(track_field), w["set"][track_field], now)
+                    if change is not None:
+                        w["set"][f"last_{track_field}_change"] = change
+                        first = w["indexes"][0]
+                        outcomes[first] = outcomes[first]._replace(previous=change["old"])
+                if w["insert_id"] is None:
+                    ops.append(UpdateOne({key_field: key}, {"$set": w["set"]}))
+                else:
+                    ops.append(UpdateOne({key_field: key}, {"$set": w["set"], "$setOnInsert": {'_id': w["insert_id"], 'created_at': now}}, upsert=True))
+            try:
+                result = collection.bulk_write(ops, ordered=False)
+                inserted = set(result.upserted_ids.values())
+                failed: Dict[int, str] = {}
+            except BulkWriteError as e:
+                inserted = {u["_id"] for u in e.details.get("upserted", [])}
+                failed = {err["index"]: err.get("errmsg", "write error") for err in e.details.get("writeErrors", [])}
+
+            ordered_writes = list(writes.values())
+            for op, message in failed.items():
+                for i in ordered_writes[op]["indexes"]:
+                    outcomes[i] = UpsertResult(None, FAILED, message)
+            # a concurrent writer may have inserted the key since the lookup
+            raced = [w for op, w in enumerate(ordered_writes)
+                     if w["insert_id"] is not None and w["insert_id"] not in inserted and op not in failed]
+            if raced:
+                keys = [batch[w["indexes"][0]][key_field] for w in raced]
+                ids = {found[key_field]: found["_id"] for found in collection.find({key_field: {"$in": keys}}, {key_field: 1})}
+                for w in raced:
+                    _id = ids.get(batch[w["indexes"][0]][key_field])
+                    for i in w["indexes"]:
+                        outcomes[i] = UpsertResult(str(_id) if _id else None, UPDATED)
+        results.extend(outcomes)
+    return results
+
+
+def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None, sort: List = None, projection: Dict[str, Any] = None):
     """Get documents from collection"""
     if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+        raise DatabaseUnavailable("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
-    cursor = db[collection_name].find(filter_dict or {})
+    cursor = db[collection_name].find(filter_dict or {}, projection)
     if sort:
         cursor = cursor.sort(sort)
     if limit:
@@ -74,9 +271,49 @@ def get_documents(collection_name: str, filter_dict: dict = None, limit: int = N
     return list(cursor)
 
 
+def get_document_by_id(collection_name: str, _id: str, projection: Dict[str, Any] = None):
+    if db is None:
+        raise DatabaseUnavailable("Database not available.")
+    if not ObjectId.is_valid(_id):
+        return None
+    return db[collection_name].find_one({"_id": ObjectId(_id)}, projection)
+
+
+def find_document(collection_name: str, filter_dict: Dict[str, Any], projection: Dict[str, Any] = None):
+    if db is None:
+        raise DatabaseUnavailable("Database not available.")
+    return db[collection_name].find_one(filter_dict, projection)
+
+
+def update_document(collection_name: str, filter_dict: Dict[str, Any], updates: Dict[str, Any]):
+    if db is None:
+        raise DatabaseUnavailable("Database not available.")
+    updates = dict(updates)
+    updates['updated_at'] = datetime.now(timezone.utc)
+    result = db[collection_name].update_one(filter_dict, {"$set": updates})
+    return result.modified_count
+
+
+def delete_document(collection_name: str, filter_dict: Dict[str, Any]):
+    if db is None:
+        raise DatabaseUnavailable("Database not available.")
+    return db[collection_name].delete_one(filter_dict).deleted_count
+
+
+def claim_document(collection_name: str, filter_dict: Dict[str, Any], updates: Dict[str, Any], sort: List = None):
+    """Atomically $set `updates` on the first document matching filter. Returns the updated document or None."""
+    if db is None:
+        raise DatabaseUnavailable("Database not available.")
+    updates = dict(updates)
+    updates['updated_at'] = datetime.now(timezone.utc)
+    return db[collection_name].find_one_and_update(
+        filter_dict, {"$set": updates}, sort=sort, return_document=ReturnDocument.AFTER
+    )
+
+
 def update_by_id(collection_name: str, _id: str, updates: Dict[str, Any]):
     if db is None:
-        raise Exception("Database not available.")
+        raise DatabaseUnavailable("Database not available.")
     updates = dict(updates)
     updates['updated_at'] = datetime.now(timezone.utc)
     result = db[collection_name].update_one({"_id": ObjectId(_id)}, {"$set": updates})
@@ -85,5 +322,29 @@ def update_by_id(collection_name: str, _id: str, updates: Dict[str, Any]):
 
 def aggregate(collection_name: str, pipeline: List[Dict[str, Any]]):
     if db is None:
-        raise Exception("Database not available.")
+        raise DatabaseUnavailable("Database not available.")
     return list(db[collection_name].aggregate(pipeline))
+
+
+def iter_documents(collection_name: str, filter_dict: dict = None, projection: Dict[str, Any] = None, sort: List = None, batch_size: int = 1000):
+    """Iterate over matching documents without materializing the whole result"""
+    if db is None:
+        raise DatabaseUnavailable("Database not available.")
+    cursor = db[collection_name].find(filter_dict or {}, projection, batch_size=batch_size)
+    if sort:
+        cursor = cursor.sort(sort)
+    return cursor
+
+
+def bulk_write_documents(collection_name: str, ops: List[Any], ordered: bool = False):
+    if db is None:
+        raise DatabaseUnavailable("Database not available.")
+    if not ops:
+        return None
+    return db[collection_name].bulk_write(ops, ordered=ordered)
+
+
+def create_index(collection_name: str, keys: List, **kwargs):
+    if db is None:
+        raise DatabaseUnavailable("Database not available.")
+    return db[collection_name].create_index(keys, **kwargs)
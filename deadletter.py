@@ -0,0 +1,92 @@
+"""
+Listing Dead Letters
+
+Items that fail to write during ingestion are stored in the
+"listing_deadletter" collection with the error, so a batch never fails
+as a whole and nothing is silently dropped.
+
+Re-submit dead letters in bulk:
+    python deadletter.py replay [--source tayara] [--limit 10000] [--batch-size 500]
+"""
+
+import argparse
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+import bson
+from bson.errors import InvalidDocument
+from pymongo import InsertOne, DeleteOne, UpdateOne
+
+from database import iter_documents, bulk_write_documents, FAILED, MAX_DOCUMENT_BYTES
+
+COLLECTION = "listing_deadletter"
+# recomputed on every write attempt
+DERIVED_FIELDS = {"content_hash", "minhash", "lsh_bands", "created_at", "updated_at"}
+
+
+def record(docs: List[Dict[str, Any]], errors: List[str]) -> int:
+    """Store failed listings with their error messages"""
+    now = datetime.now(timezone.utc)
+    ops = []
+    for doc, error in zip(docs, errors):
+        letter = {"source": doc.get('source'), "item": {k: v for k, v in doc.items() if k not in DERIVED_FIELDS},
+                  "error": error, "attempts": 1, "created_at": now, "updated_at": now}
+        try:
+            too_large = len(bson.encode(letter)) > MAX_DOCUMENT_BYTES
+        except (InvalidDocument, TypeError, OverflowError):
+            too_large = True
+        if too_large:
+            # the item itself cannot be stored; keep a readable copy instead
+            del letter["item"]
+            letter["item_repr"] = repr(doc)[:10000]
+        ops.append(InsertOne(letter))
+    bulk_write_documents(COLLECTION, ops)
+    return len(ops)
+
+
+def replay(source: Optional[str] = None, limit: Optional[int] = None, batch_size: int = 500) -> Dict[str, int]:
+    """Re-submit dead letters through the ingest write path; successes are removed"""
+    from ingest import write_items
+
+    query: Dict[str, Any] = {"item": {"$exists": True}}
+    if source:
+        query["source"] = source
+    stats = {"replayed": 0, "failed": 0}
+    batch: List[Dict[str, Any]] = []
+
+    def flush():
+        results = write_items([dict(letter["item"]) for letter in batch], dead_letter=False)
+        now = datetime.now(timezone.utc)
+        ops = []
+        for letter, result in zip(batch, results):
+            if result.status == FAILED:
+                ops.append(UpdateOne({"_id": letter["_id"]}, {"$set": {"error": result.error, "updated_at": now}, "$inc": {"attempts": 1}}))
+                stats["failed"] += 1
+            else:
+                ops.append(DeleteOne({"_id": letter["_id"]}))
+                stats["replayed"] += 1
+        bulk_write_documents(COLLECTION, ops)
+        batch.clear()
+
+    for n, letter in enumerate(iter_documents(COLLECTION, query, sort=[["created_at", 1]])):
+        if limit is not None and n >= limit:
+            break
+        batch.append(letter)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Listing dead-letter maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    r = sub.add_parser("replay", help="Re-submit dead-lettered listings in bulk")
+    r.add_argument("--source")
+    r.add_argument("--limit", type=int)
+    r.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        print(replay(source=args.source, limit=args.limit, batch_size=args.batch_size))
@@ -0,0 +1,217 @@
+"""
+Listing Deduplication Keys
+
+Dedup keys are fixed-size digests of canonicalized listing identity:
+the listing URL when present, otherwise title + price + posted_at.
+URLs are canonicalized per source first (host aliases, tracking params,
+fragments, trailing slashes) so variants of one listing share a key.
+Keys are stored as 16-byte binary values under a unique index on
+listing.dedup_key.
+
+Migrate existing listings to the new key format:
+    python dedup.py migrate [--batch-size 1000] [--dry-run] [--rekey]
+"""
+
+import argparse
+import hashlib
+import json
+import re
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from pymongo import UpdateOne
+
+from database import iter_documents, bulk_write_documents
+
+KEY_BYTES = 16
+
+# Query params that never identify a listing
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "igshid", "mibextid", "rdid", "share_url",
+    "ref", "ref_src", "referrer", "source", "_rdr", "_rdc", "__tn__", "__xts__", "__cft__",
+    "hc_ref", "hc_location", "notif_id", "notif_t", "sfnsn", "s", "si", "tracking",
+}
+TRACKING_PREFIXES = ("utm_", "__cft__", "__xts__", "hc_", "_ga", "mc_")
+
+# Per-source host aliases and the only query params that identify a listing.
+# None means "keep every non-tracking param".
+HOST_ALIASES = {
+    "facebook": {"m.facebook.com": "facebook.com", "mbasic.facebook.com": "facebook.com",
+                 "web.facebook.com": "facebook.com", "touch.facebook.com": "facebook.com",
+                 "fb.com": "facebook.com"},
+    "tayara": {"m.tayara.tn": "tayara.tn"},
+    "tunisie-annonces": {"m.tunisie-annonces.com": "tunisie-annonces.com"},
+}
+IDENTITY_PARAMS = {
+    "facebook": {"story_fbid", "fbid", "id", "set", "v", "multi_permalinks"},
+    "tayara": set(),
+    "tunisie-annonces": {"cod_ann"},
+    "other": None,
+}
+# Tayara item URLs carry a free-form slug after the id: /item/<id>/<slug>/
+_TAYARA_ITEM = re.compile(r"^(/item/[^/]+)")
+_SLASHES = re.compile(r"/{2,}")
+
+
+def _is_tracking(param: str) -> bool:
+    param = param.lower()
+    return param in TRACKING_PARAMS or param.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url: Any, source: Optional[str] = None) -> str:
+    """Normalize a listing URL so tracking and cosmetic variants compare equal"""
+    raw = str(url).strip()
+    try:
+        parts = urlsplit(raw)
+    except ValueError:
+        return raw
+    if not parts.netloc:
+        return raw
+
+    host = (parts.hostname or "").lower().rstrip(".")
+    if host.startswith("www."):
+        host = host[4:]
+    host = HOST_ALIASES.get(source, {}).get(host, host)
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = _SLASHES.sub("/", parts.path or "/")
+    if source == "tayara":
+        m = _TAYARA_ITEM.match(path)
+        if m:
+            path = m.group(1)
+    if len(path) > 1:
+        path = path.rstrip("/")
+
+    keep = IDENTITY_PARAMS.get(source)
+    params = []
+    for k, v in parse_qsl(parts.query, keep_blank_values=False):
+        if keep is not None:
+            if k in keep:
+                params.append((k, v))
+        elif not _is_tracking(k):
+            params.append((k, v))
+    params.sort()
+
+    # http/https variants are the same listing
+    return urlunsplit(("https", host, path, urlencode(params), ""))
+
+
+def _canonical_text(value: Any) -> str:
+    return " ".join(str(value).split()).casefold() if value is not None else ""
+
+
+def _canonical_price(value: Any) -> str:
+    if value is None or value == "":
+        return ""
+    try:
+        return repr(float(value))
+    except (TypeError, ValueError):
+        return _canonical_text(value)
+
+
+def _canonical_datetime(value: Any) -> str:
+    if value is None or value == "":
+        return ""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return value.strip()
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat()
+    return str(value)
+
+
+def canonical_identity(item: Dict[str, Any]) -> str:
+    """Canonical string identifying a listing: url OR title+price+posted_at"""
+    url = item.get('url')
+    if url:
+        return "u|" + canonicalize_url(url, item.get('source'))
+    # a price read from the text (extract.py) is not part of the identity the item was keyed with
+    price = None if 'price' in (item.get('extraction') or {}) else item.get('price')
+    return "t|" + "|".join((
+        _canonical_text(item.get('title')),
+        _canonical_price(price),
+        _canonical_datetime(item.get('posted_at')),
+    ))
+
+
+def build_dedup_key(item: Dict[str, Any]) -> bytes:
+    """Compact binary dedup key for a listing (stored as BSON binary subtype 0)"""
+    return hashlib.blake2b(canonical_identity(item).encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+# Fields that are not listing content: keys, timestamps, moderation and derived data
+NON_CONTENT_FIELDS = {
+    "_id", "dedup_key", "content_hash", "created_at", "updated_at", "status",
+    "minhash", "lsh_bands", "cluster_id", "duplicate_of",
+}
+
+
+def content_fingerprint(item: Dict[str, Any]) -> bytes:
+    """Digest of a listing's content, used to skip writes of unchanged re-ingested items"""
+    content = {k: v for k, v in item.items() if k not in NON_CONTENT_FIELDS and v is not None}
+    encoded = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+def migrate(batch_size: int = 1000, dry_run: bool = False, rekey: bool = False) -> Dict[str, int]:
+    """
+    Rewrite dedup keys to the current hashed format.
+    By default only legacy string keys are rewritten; `rekey` recomputes every
+    key (needed after canonicalization rules change).
+    Listings that collapse onto an existing key keep no dedup_key and point
+    at the surviving listing through `duplicate_of`.
+    """
+    seen: Dict[bytes, Any] = {}
+    if not rekey:
+        for doc in iter_documents("listing", {"dedup_key": {"$type": "binData"}}, {"dedup_key": 1}):
+            seen[doc["dedup_key"]] = doc["_id"]
+
+    stats = {"rewritten": 0, "duplicates": 0, "unchanged": 0}
+    duplicates, rewrites = [], []
+    projection = {"url": 1, "source": 1, "title": 1, "price": 1, "posted_at": 1, "dedup_key": 1, "extraction": 1}
+    query: Dict[str, Any] = {"duplicate_of": {"$exists": False}}
+    if not rekey:
+        query["dedup_key"] = {"$not": {"$type": "binData"}}
+    for doc in iter_documents("listing", query, projection, sort=[["created_at", 1], ["_id", 1]]):
+        key = build_dedup_key(doc)
+        survivor: Optional[Any] = seen.get(key)
+        if survivor == doc["_id"]:
+            continue
+        if survivor is None:
+            seen[key] = doc["_id"]
+            if doc.get("dedup_key") == key:
+                stats["unchanged"] += 1
+            else:
+                rewrites.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"dedup_key": key}}))
+                stats["rewritten"] += 1
+        else:
+            duplicates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"duplicate_of": survivor}, "$unset": {"dedup_key": ""}}))
+            stats["duplicates"] += 1
+
+    if not dry_run:
+        # release keys held by duplicates before survivors claim them under the unique index
+        for ops in (duplicates, rewrites):
+            for start in range(0, len(ops), batch_size):
+                bulk_write_documents("listing", ops[start:start + batch_size])
+        from indexes import ensure
+        ensure("listing", "dedup_key_unique")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Listing dedup key maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    m = sub.add_parser("migrate", help="Rewrite existing listings to hashed dedup keys")
+    m.add_argument("--batch-size", type=int, default=1000)
+    m.add_argument("--dry-run", action="store_true")
+    m.add_argument("--rekey", action="store_true", help="Recompute every key, not only legacy string keys")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        print(migrate(batch_size=args.batch_size, dry_run=args.dry_run, rekey=args.rekey))
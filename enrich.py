@@ -0,0 +1,104 @@
+"""
+Listing Enrichment
+
+Ordered in-process stages that derive fields from a listing's own data.
+Every stage takes a list of documents and fills fields in place; the
+ingest write path runs them all before fingerprinting, so enriched
+fields are written together with the listing.
+
+Enrich listings stored before a stage existed (or after its data changed):
+    python enrich.py backfill [--stage geocode] [--all] [--batch-size 1000]
+"""
+
+import argparse
+from typing import List, Dict, Any, Callable, NamedTuple, Optional
+
+from pymongo import UpdateOne
+
+from database import iter_documents, bulk_write_documents
+import extract
+import geocode
+import pricing
+import search
+
+
+class Stage(NamedTuple):
+    name: str
+    run: Callable[[List[Dict[str, Any]]], None]
+    inputs: List[str]    # fields the stage reads
+    outputs: List[str]   # fields the stage writes; the first marks enriched listings
+
+
+STAGES = [
+    Stage("extract", extract.extract_batch, ["title", "description", "price", "bedrooms", "surface_m2", "currency", "extraction"],
+          ["extraction", "price", "bedrooms", "surface_m2", "currency"]),
+    Stage("geocode", geocode.enrich, ["city", "area", "lat", "lng", "geo_precision"],
+          ["geocoded_city", "geocoded_area", "lat", "lng", "geo_precision"]),
+    Stage("normalize", geocode.normalize, ["city", "area"], ["city_norm", "area_norm"]),
+    Stage("price", pricing.enrich, ["price", "currency", "surface_m2"], ["price_tnd", "price_per_m2"]),
+    Stage("search", search.index_text, ["title", "city", "description"], ["search_ar"]),
+]
+
+# outputs that never come from a source: ingest drops them from client payloads
+DERIVED_FIELDS = frozenset({"extraction", "geocoded_city", "geocoded_area", "geo_precision",
+                            "city_norm", "area_norm", "price_tnd", "price_per_m2", "search_ar"})
+
+
+def enrich_batch(docs: List[Dict[str, Any]], stages: Optional[List[Stage]] = None) -> List[Dict[str, Any]]:
+    """Run enrichment stages over prepared listings (in place)"""
+    for stage in stages or STAGES:
+        stage.run(docs)
+    return docs
+
+
+def _stages(names: Optional[List[str]]) -> List[Stage]:
+    if not names:
+        return STAGES
+    unknown = set(names) - {s.name for s in STAGES}
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+    return [s for s in STAGES if s.name in names]
+
+
+def backfill(names: Optional[List[str]] = None, everything: bool = False, batch_size: int = 1000) -> Dict[str, int]:
+    """Run stages over stored listings and write back the fields that changed.
+    Without `everything`, only listings missing a stage's first output are visited."""
+    stages = _stages(names)
+    projection = {f: 1 for s in stages for f in s.inputs + s.outputs}
+    query: Dict[str, Any] = {} if everything else {"$or": [{s.outputs[0]: {"$exists": False}} for s in stages]}
+    stats = {"scanned": 0, "updated": 0}
+    batch: List[Dict[str, Any]] = []
+
+    def flush():
+        before = [{f: doc.get(f) for f in projection} for doc in batch]
+        enrich_batch(batch, stages)
+        ops = []
+        for doc, old in zip(batch, before):
+            changed = {f: doc[f] for f in projection if f in doc and doc[f] != old[f]}
+            if changed:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": changed}))
+        bulk_write_documents("listing", ops)
+        stats["scanned"] += len(batch)
+        stats["updated"] += len(ops)
+        batch.clear()
+
+    for doc in iter_documents("listing", query, projection, batch_size=batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Listing enrichment maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("backfill", help="Enrich stored listings")
+    b.add_argument("--stage", action="append", help=f"Stage to run (repeatable; default all: {', '.join(s.name for s in STAGES)})")
+    b.add_argument("--all", action="store_true", help="Re-enrich every listing, not only those missing the fields")
+    b.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        print(backfill(args.stage, everything=args.all, batch_size=args.batch_size))
@@ -0,0 +1,153 @@
+"""
+Free-Text Extraction
+
+Fills `price`, `bedrooms` and `surface_m2` from title and description
+when a listing arrives without them ("S+2", "120 m²", "1.200 DT",
+"350 mille", "1,2 million"). Patterns are compiled once and each field is
+found with a single scan of the listing text; listings that already
+carry every field are not scanned.
+
+Extracted values are recorded with a confidence in `extraction`, e.g.
+{"price": 0.9, "bedrooms": 0.95}, or None when nothing was extracted. It is
+recomputed on every pass, so fields supplied by the source never appear
+there and are never overwritten.
+"""
+
+import re
+from typing import List, Dict, Any, Optional, Tuple
+
+FIELDS = ("price", "bedrooms", "surface_m2")
+MIN_PRICE, MAX_PRICE = 50, 100_000_000
+MIN_SURFACE, MAX_SURFACE = 8, 1_000_000
+MAX_BEDROOMS = 20
+DISAGREEMENT_PENALTY = 0.7   # several different values in one text
+
+# "1.200", "350 000" and "1,200" group thousands; a trailing ",5" / ".500" is a fraction.
+# A number never starts right after a letter: the "2" of "m2 800 DT" is not 2800.
+_NUMBER = r"(?<![\w+.,])(\d{1,3}(?:[ .,\u00a0\u202f]\d{3})+|\d+)(?:[.,](\d{1,3}))?"
+# surfaces are never written with space separators; "S+2 120 m²" is not 2120 m²
+_PLAIN_NUMBER = r"(?<![\w+.,])(\d{1,3}(?:[.,]\d{3})+|\d+)(?:[.,](\d{1,3}))?"
+
+_BEDROOMS = re.compile(
+    r"\bs\s*\+\s*(?P<splus>\d{1,2})\b"
+    r"|\b(?P<rooms>\d{1,2})\s*(?:chambres?|chbres?|ch\b|bedrooms?|غرف)"
+    r"|\b(?P<pieces>\d{1,2})\s*pi[eè]ces?\b"
+    r"|\b(?P<studio>studio)\b",
+    re.IGNORECASE,
+)
+_SURFACE = re.compile(
+    _PLAIN_NUMBER + r"\s*(?:m²|m2|mq|m\.?\s*carr[ée]s?|m[eè]tres?\s*carr[ée]s?|متر)",
+    re.IGNORECASE,
+)
+_PRICE = re.compile(
+    _NUMBER + r"\s*(?:"
+    r"(?P<million>millions?|mdt\b)"
+    r"|(?P<mille>milles?|md\b|k\b|[أا]لف)"
+    r"|(?P<currency>dt\b|tnd\b|dinars?\b|د\.?\s?ت|€|eur\b|euros?\b))",
+    re.IGNORECASE,
+)
+_PRICE_LABEL = re.compile(r"\b(?:prix|price|loyer|السعر)\s*:?\s*" + _NUMBER, re.IGNORECASE)
+_CURRENCIES = {"€": "EUR", "eur": "EUR", "euro": "EUR", "euros": "EUR"}
+
+# confidence per pattern
+_CONF = {"splus": 0.95, "rooms": 0.85, "pieces": 0.6, "studio": 0.7,
+         "surface": 0.9, "currency": 0.9, "mille": 0.8, "million": 0.8, "label": 0.6}
+
+
+def _number(whole: str, fraction: Optional[str]) -> float:
+    if "." in whole and "," in whole:
+        # "1.200,500": the last separator is the decimal point (dinars, millimes)
+        cut = max(whole.rfind("."), whole.rfind(","))
+        whole, fraction = whole[:cut], whole[cut + 1:] + (fraction or "")
+    digits = re.sub(r"[ .,\u00a0\u202f]", "", whole)
+    value = float(digits)
+    if fraction:
+        value += float("0." + fraction)
+    return value
+
+
+def _pick(found: List[Tuple[float, float]]) -> Optional[Tuple[float, float]]:
+    """First value, with lower confidence when the text disagrees with itself"""
+    if not found:
+        return None
+    value, conf = found[0]
+    if any(v != value for v, _ in found[1:]):
+        conf *= DISAGREEMENT_PENALTY
+    return value, round(conf, 2)
+
+
+def bedrooms(text: str) -> Optional[Tuple[int, float]]:
+    found = []
+    for m in _BEDROOMS.finditer(text):
+        kind = m.lastgroup
+        if kind == "studio":
+            value = 0
+        elif kind == "pieces":
+            value = int(m.group(kind)) - 1  # "3 pièces" = living room + 2 bedrooms
+        else:
+            value = int(m.group(kind))
+        if 0 <= value <= MAX_BEDROOMS:
+            found.append((value, _CONF[kind]))
+    picked = _pick(found)
+    return (int(picked[0]), picked[1]) if picked else None
+
+
+def surface(text: str) -> Optional[Tuple[float, float]]:
+    found = []
+    for m in _SURFACE.finditer(text):
+        value = _number(m.group(1), m.group(2))
+        if MIN_SURFACE <= value <= MAX_SURFACE:
+            found.append((value, _CONF["surface"]))
+    return _pick(found)
+
+
+def price(text: str) -> Optional[Tuple[float, float, Optional[str]]]:
+    """(value, confidence, currency code or None)"""
+    found, currency = [], None
+    for m in _PRICE.finditer(text):
+        value = _number(m.group(1), m.group(2))
+        if m.group("million"):
+            value, kind = value * 1_000_000, "million"
+        elif m.group("mille"):
+            value, kind = value * 1000, "mille"
+        else:
+            kind = "currency"
+            if currency is None:
+                currency = _CURRENCIES.get(m.group("currency").lower(), "TND")
+        if MIN_PRICE <= value <= MAX_PRICE:
+            found.append((value, _CONF[kind]))
+    if not found:
+        for m in _PRICE_LABEL.finditer(text):
+            value = _number(m.group(1), m.group(2))
+            if MIN_PRICE <= value <= MAX_PRICE:
+                found.append((value, _CONF["label"]))
+    picked = _pick(found)
+    return (picked[0], picked[1], currency) if picked else None
+
+
+_EXTRACTORS = {"price": price, "bedrooms": bedrooms, "surface_m2": surface}
+
+
+def extract_batch(docs: List[Dict[str, Any]]):
+    """Fill missing price/bedrooms/surface_m2 from listing text (in place)"""
+    for doc in docs:
+        text = " \n ".join(t for t in (doc.get('title'), doc.get('description')) if isinstance(t, str))
+        if not text:
+            continue
+        previous = doc.get('extraction') or {}
+        missing = [f for f in FIELDS if doc.get(f) is None or f in previous]
+        extraction = {}
+        for field in missing:
+            result = _EXTRACTORS[field](text)
+            if result is None:
+                if field in previous:
+                    # no longer in the text: drop the value read from it before
+                    doc[field] = None
+                continue
+            doc[field] = result[0]
+            extraction[field] = result[1]
+            if field == "price" and result[2] and not doc.get('currency'):
+                doc['currency'] = result[2]
+        # always replaced, so a field the source now supplies loses its stale confidence;
+        # None rather than {} keeps the content fingerprint of listings without extractions stable
+        doc['extraction'] = extraction or None
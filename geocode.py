@@ -0,0 +1,306 @@
+"""
+Offline Geocoding
+
+Resolves free-text `city` / `area` against a bundled gazetteer of Tunisian
+governorates, delegations and localities (data/tn_gazetteer.csv, French
+and Arabic names plus common spellings), and reverse-geocodes lat/lng to
+the nearest gazetteer place. Everything is in memory: names are looked up
+exactly, by word window, by unique prefix and finally by trigram
+similarity for misspellings; coordinates go through a small k-d tree.
+Results are cached per (city, area), so batches mostly hit the cache.
+
+Fills on each listing:
+    geocoded_city   governorate name
+    geocoded_area   delegation / locality name, when known
+    lat, lng        place coordinates, unless the source supplied them
+    geo_precision   "source", "locality", "delegation" or "governorate"
+    city_norm       canonical key of the place named by `city` (see place_key)
+    area_norm       same for `area`
+"""
+
+import bisect
+import csv
+import math
+import os
+import re
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, NamedTuple, Tuple
+
+from textnorm import fold, transliterate
+
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "tn_gazetteer.csv"))
+MIN_SIMILARITY = 0.5       # trigram Dice score for fuzzy matches
+MAX_WINDOW_WORDS = 4       # longest gazetteer name, in words, searched inside free text
+MAX_REVERSE_KM = 25        # farther than this from any place: leave reverse geocoding empty
+SOURCE = "source"
+
+# equirectangular projection around Tunisia's mean latitude; good enough for nearest-place
+_LNG_SCALE = math.cos(math.radians(34.0))
+_KM_PER_DEGREE = 111.2
+_KIND_RANK = {"locality": 0, "delegation": 1, "governorate": 2}
+# leading articles dropped from keys, so "La Marsa", "Marsa" and "المرسى" agree
+ARTICLES = {"la", "le", "les", "l", "el", "al"}
+
+
+class Place(NamedTuple):
+    name: str
+    kind: str
+    governorate: str
+    lat: float
+    lng: float
+
+
+class Match(NamedTuple):
+    city: str
+    area: Optional[str]
+    lat: float
+    lng: float
+    precision: str
+
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class KDTree:
+    """Static 2-d tree over projected (x, y) points for nearest-neighbour queries"""
+
+    def __init__(self, points: List[Tuple[float, float]]):
+        self.points = points
+        # nodes: (point index, axis, left node, right node); -1 for no child
+        self.nodes: List[Tuple[int, int, int, int]] = []
+        self.root = self._build(list(range(len(points))), 0)
+
+    def _build(self, indexes: List[int], depth: int) -> int:
+        if not indexes:
+            return -1
+        axis = depth % 2
+        indexes.sort(key=lambda i: self.points[i][axis])
+        mid = len(indexes) // 2
+        node = len(self.nodes)
+        self.nodes.append(None)
+        left = self._build(indexes[:mid], depth + 1)
+        right = self._build(indexes[mid + 1:], depth + 1)
+        self.nodes[node] = (indexes[mid], axis, left, right)
+        return node
+
+    def nearest(self, x: float, y: float) -> Tuple[int, float]:
+        """(point index, squared distance) of the closest point"""
+        best, best_d2 = -1, float("inf")
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node < 0:
+                continue
+            i, axis, left, right = self.nodes[node]
+            px, py = self.points[i]
+            d2 = (px - x) ** 2 + (py - y) ** 2
+            if d2 < best_d2:
+                best, best_d2 = i, d2
+            delta = (x if axis == 0 else y) - (px if axis == 0 else py)
+            near, far = (left, right) if delta < 0 else (right, left)
+            # far side only when the splitting plane is closer than the best so far
+            if delta * delta < best_d2:
+                stack.append(far)
+            stack.append(near)
+        return best, best_d2
+
+
+class Gazetteer:
+    def __init__(self, places: List[Place], aliases: List[List[str]]):
+        self.places = places
+        self.by_key: Dict[str, List[int]] = {}
+        for i, (place, names) in enumerate(zip(places, aliases)):
+            for name in [place.name] + names:
+                key = fold(name)
+                if key and i not in self.by_key.setdefault(key, []):
+                    self.by_key[key].append(i)
+        self.keys = sorted(self.by_key)
+        self.trigrams: Dict[str, List[str]] = {}
+        for key in self.keys:
+            for gram in _trigrams(key):
+                self.trigrams.setdefault(gram, []).append(key)
+        self.tree = KDTree([(p.lng * _LNG_SCALE, p.lat) for p in places])
+
+    @classmethod
+    def load(cls, path: str = GAZETTEER_PATH) -> "Gazetteer":
+        places, aliases = [], []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                places.append(Place(row["name"], row["kind"], row["governorate"], float(row["lat"]), float(row["lng"])))
+                aliases.append([a for a in (row.get("aliases") or "").split("|") if a.strip()])
+        return cls(places, aliases)
+
+    def _pick(self, ids: List[int], governorate: Optional[str]) -> Place:
+        candidates = [self.places[i] for i in ids]
+        if governorate:
+            inside = [p for p in candidates if p.governorate == governorate]
+            candidates = inside or candidates
+        return min(candidates, key=lambda p: _KIND_RANK.get(p.kind, 3))
+
+    def _prefix(self, key: str) -> Optional[List[int]]:
+        """Places whose name starts with `key`, when they are all the same place"""
+        start = bisect.bisect_left(self.keys, key)
+        ids = set()
+        for k in self.keys[start:]:
+            if not k.startswith(key):
+                break
+            ids.update(self.by_key[k])
+            if len(ids) > 1:
+                return None
+        return list(ids) or None
+
+    def _fuzzy(self, key: str) -> Optional[List[int]]:
+        grams = _trigrams(key)
+        counts: Dict[str, int] = {}
+        for gram in grams:
+            for k in self.trigrams.get(gram, ()):
+                counts[k] = counts.get(k, 0) + 1
+        best, best_score = None, MIN_SIMILARITY
+        for k, shared in counts.items():
+            score = 2 * shared / (len(grams) + len(_trigrams(k)))
+            if score > best_score:
+                best, best_score = k, score
+        return self.by_key[best] if best else None
+
+    def lookup(self, text: Any, governorate: Optional[str] = None) -> Optional[Place]:
+        """Best gazetteer place for a free-text name, preferring `governorate`"""
+        key = fold(text)
+        if not key:
+            return None
+        ids = self.by_key.get(key)
+        if ids:
+            return self._pick(ids, governorate)
+        # names embedded in longer text ("Appartement S+2 La Marsa"), longest window first
+        words = key.split()
+        for size in range(min(MAX_WINDOW_WORDS, len(words)), 0, -1):
+            found = []
+            for start in range(len(words) - size + 1):
+                found.extend(self.by_key.get(" ".join(words[start:start + size]), ()))
+            if found:
+                return self._pick(found, governorate)
+        if len(key) >= 3:
+            ids = self._prefix(key)
+            if ids:
+                return self._pick(ids, governorate)
+        if len(key) >= 4:
+            ids = self._fuzzy(key)
+            if ids:
+                return self._pick(ids, governorate)
+        return None
+
+    def nearest(self, lat: float, lng: float) -> Optional[Place]:
+        i, d2 = self.tree.nearest(lng * _LNG_SCALE, lat)
+        if i < 0 or math.sqrt(d2) * _KM_PER_DEGREE > MAX_REVERSE_KM:
+            return None
+        return self.places[i]
+
+
+_gazetteer: Optional[Gazetteer] = None
+
+
+def gazetteer() -> Gazetteer:
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = Gazetteer.load()
+    return _gazetteer
+
+
+def _match(place: Place) -> Match:
+    area = place.name if place.kind != "governorate" else None
+    return Match(place.governorate, area, place.lat, place.lng, place.kind)
+
+
+@lru_cache(maxsize=65536)
+def geocode(city: Optional[str], area: Optional[str] = None) -> Optional[Match]:
+    """Resolve free-text city/area. The area wins when both resolve."""
+    g = gazetteer()
+    city_place = g.lookup(city) if city else None
+    area_place = g.lookup(area, city_place.governorate if city_place else None) if area else None
+    if area_place is not None and area_place.kind != "governorate":
+        return _match(area_place)
+    if city_place is not None:
+        return _match(city_place)
+    return _match(area_place) if area_place is not None else None
+
+
+def _key(text: Any) -> str:
+    words = transliterate(text).split()
+    if len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+
+@lru_cache(maxsize=65536)
+def place_key(text: Optional[str]) -> Optional[str]:
+    """
+    Canonical, accent-, case- and script-insensitive key for a place name:
+    the gazetteer name when the text resolves (synonyms, Arabic names,
+    spelling variants), otherwise the transliterated text itself.
+    """
+    if not text:
+        return None
+    place = gazetteer().lookup(text)
+    return _key(place.name if place is not None else text) or None
+
+
+def known_key(key: str) -> bool:
+    """True when `key` is the canonical key of a gazetteer place"""
+    return key in _place_names()
+
+
+@lru_cache(maxsize=1)
+def _place_names() -> Dict[str, str]:
+    names: Dict[str, str] = {}
+    for place in gazetteer().places:
+        names.setdefault(_key(place.name), place.name)
+    return names
+
+
+def place_name(key: Optional[str]) -> Optional[str]:
+    """Display name for a place key (the key itself when not in the gazetteer)"""
+    return _place_names().get(key, key) if key else None
+
+
+def place_filter(text: str) -> Optional[Dict[str, Any]]:
+    """Index-friendly condition on a *_norm field for a user-supplied place name:
+    exact for gazetteer places, anchored prefix otherwise"""
+    key = place_key(text)
+    if key is None:
+        return None
+    return key if known_key(key) else {"$regex": "^" + re.escape(key)}
+
+
+@lru_cache(maxsize=65536)
+def reverse(lat: float, lng: float) -> Optional[Match]:
+    """Nearest gazetteer place to a coordinate, within MAX_REVERSE_KM"""
+    place = gazetteer().nearest(lat, lng)
+    return _match(place) if place is not None else None
+
+
+def enrich(docs: List[Dict[str, Any]]):
+    """Fill geocoded_city/area, lat/lng and geo_precision on listings (in place).
+    Coordinates sent by the source are kept; derived ones are recomputed."""
+    for doc in docs:
+        derived = doc.get('geo_precision') not in (None, SOURCE)
+        has_coords = not derived and isinstance(doc.get('lat'), (int, float)) and isinstance(doc.get('lng'), (int, float))
+        match = geocode(doc.get('city'), doc.get('area')) if (doc.get('city') or doc.get('area')) else None
+        if match is None and has_coords:
+            match = reverse(round(doc['lat'], 4), round(doc['lng'], 4))
+        if has_coords:
+            doc['geo_precision'] = SOURCE
+        if match is None:
+            continue
+        doc['geocoded_city'], doc['geocoded_area'] = match.city, match.area
+        if not has_coords:
+            doc['lat'], doc['lng'], doc['geo_precision'] = match.lat, match.lng, match.precision
+
+
+def normalize(docs: List[Dict[str, Any]]):
+    """Set city_norm / area_norm keys on listings (in place)"""
+    for doc in docs:
+        if 'city' in doc:
+            doc['city_norm'] = place_key(doc['city'])
+        if 'area' in doc:
+            doc['area_norm'] = place_key(doc['area'])
@@ -0,0 +1,84 @@
+"""
+Idempotency Keys
+
+Clients may send an `Idempotency-Key` header on write endpoints. The first
+request with a key records its response in the "idempotency" collection
+(expired by a TTL index); retries with the same key get the stored
+response back without running the write again.
+
+A key being processed holds a lease (LEASE_SECONDS). Retries within the
+lease get 409; once it has expired, e.g. because the process handling the
+first request died, the next retry takes the key over and runs the write.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from database import create_document, find_document, update_document, delete_document, claim_document
+
+COLLECTION = "idempotency"
+TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 24 * 3600))
+LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", 300))
+MAX_KEY_LENGTH = 255
+
+
+def request_digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _begin(record_id: str, digest: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Claim the key. Returns the stored record when the key was already used."""
+    now = datetime.now(timezone.utc)
+    lease_until = now + timedelta(seconds=LEASE_SECONDS)
+    try:
+        create_document(COLLECTION, {"_id": record_id, "status": "in_progress", "request_hash": digest,
+                                     "lease_until": lease_until})
+        return None
+    except DuplicateKeyError:
+        pass
+    # take over a key whose handler died without finishing (records without a lease predate it)
+    stale = claim_document(COLLECTION, {
+        "_id": record_id, "status": "in_progress", "$or": [
+            {"lease_until": {"$lt": now}},
+            {"lease_until": {"$exists": False}, "created_at": {"$lt": now - timedelta(seconds=LEASE_SECONDS)}},
+        ]}, {"lease_until": lease_until, "request_hash": digest})
+    if stale is not None:
+        return None
+    record = find_document(COLLECTION, {"_id": record_id})
+    if record is None:
+        # expired between the insert attempt and the lookup
+        return _begin(record_id, digest)
+    if digest and record.get("request_hash") and record["request_hash"] != digest:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    if record.get("status") != "done":
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    return record
+
+
+def run(scope: str, key: str, digest: Optional[str], handler: Callable[[], Tuple[int, Any]]) -> Tuple[int, Any, bool]:
+    """
+    Run `handler` at most once per (scope, key) within the TTL.
+    `handler` returns (status_code, body). Returns (status_code, body, replayed).
+    Failed handlers release the key so the client can retry.
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+    record_id = f"{scope}:{key}"
+    record = _begin(record_id, digest)
+    if record is not None:
+        return record["status_code"], record["body"], True
+    try:
+        status_code, body = handler()
+    except BaseException:
+        delete_document(COLLECTION, {"_id": record_id})
+        raise
+    if status_code >= 500:
+        delete_document(COLLECTION, {"_id": record_id})
+    else:
+        update_document(COLLECTION, {"_id": record_id}, {"status": "done", "status_code": status_code, "body": body})
+    return status_code, body, False
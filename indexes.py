@@ -0,0 +1,174 @@
+"""
+Index Registry
+
+Every index the application relies on, declared in one place and applied
+idempotently at startup. `check` compares the registry with the indexes
+that exist: "missing" ones are created by `apply`, "conflict" ones exist
+under the same name with other keys/options (recreated with --rebuild),
+and "extra" ones exist without being declared (dropped with --drop-extra).
+
+    python indexes.py check
+    python indexes.py apply [--rebuild] [--drop-extra]
+"""
+
+import argparse
+import sys
+from typing import List, Dict, Any, NamedTuple, Optional
+
+import database
+import deadletter
+import idempotency
+import jobs
+import pricing
+import search
+
+# /api/listings default order; _id keeps cursor positions unique (paging.py)
+NEWEST = [("posted_at", -1), ("created_at", -1), ("_id", -1)]
+
+
+class Index(NamedTuple):
+    name: str
+    keys: List[tuple]
+    options: Dict[str, Any] = {}
+
+
+REGISTRY: Dict[str, List[Index]] = {
+    "listing": [
+        # upserts look up by key; legacy string keys stay out until migrated (dedup.py)
+        Index("dedup_key_unique", [("dedup_key", 1)],
+              {"unique": True, "partialFilterExpression": {"dedup_key": {"$type": "binData"}}}),
+        Index("lsh_bands", [("lsh_bands", 1)]),
+        # keyword search (search.py); a collection has at most one text index
+        Index("listing_text", [(field, "text") for field in search.TEXT_WEIGHTS],
+              {"weights": search.TEXT_WEIGHTS, "default_language": search.TEXT_LANGUAGE}),
+        # /api/listings filters, equality first, then the default sort
+        Index("newest", NEWEST),
+        Index("city_norm_newest", [("city_norm", 1)] + NEWEST),
+        Index("deal_property_newest", [("deal_type", 1), ("property_type", 1)] + NEWEST),
+        Index("source_newest", [("source", 1)] + NEWEST),
+        Index("area_norm", [("area_norm", 1)]),
+        # price sorts (ascending and descending, newest first on ties), also serve price ranges
+        Index("price_tnd_newest", [("price_tnd", 1), ("created_at", -1), ("_id", -1)]),
+        Index("price_tnd_desc_newest", [("price_tnd", -1), ("created_at", -1), ("_id", -1)]),
+        Index("price_per_m2_newest", [("price_per_m2", 1), ("created_at", -1), ("_id", -1)]),
+        Index("price_per_m2_desc_newest", [("price_per_m2", -1), ("created_at", -1), ("_id", -1)]),
+        Index("bedrooms", [("bedrooms", 1)]),
+        Index("last_price_tnd_change_delta", [(f"{pricing.CHANGE_FIELD}.delta", 1)], {"sparse": True}),
+        # backfills and migrations walk listings oldest first
+        Index("created_at", [("created_at", 1)]),
+        # search_index.py syncs listings changed since its watermark
+        Index("updated_at", [("updated_at", 1)]),
+    ],
+    "savedsearch": [
+        Index("created_at", [("created_at", -1)]),
+        Index("user_id", [("user_id", 1)]),
+    ],
+    "alert": [
+        Index("search_listing_channel", [("saved_search_id", 1), ("listing_id", 1), ("channel", 1)]),
+        Index("sent_at", [("sent_at", -1)]),
+    ],
+    jobs.COLLECTION: [
+        Index("status_created_at", [("status", 1), ("created_at", 1)]),
+    ],
+    jobs.ITEMS_COLLECTION: [
+        Index("job_seq", [("job_id", 1), ("seq", 1)]),
+        Index("items_ttl", [("created_at", 1)], {"expireAfterSeconds": jobs.ITEMS_TTL_SECONDS}),
+    ],
+    idempotency.COLLECTION: [
+        Index("idempotency_ttl", [("created_at", 1)], {"expireAfterSeconds": idempotency.TTL_SECONDS}),
+    ],
+    deadletter.COLLECTION: [
+        Index("source_created_at", [("source", 1), ("created_at", 1)]),
+    ],
+    pricing.HISTORY_COLLECTION: [
+        Index("listing_at", [("listing_id", 1), ("at", -1)]),
+    ],
+}
+
+# options compared against the server's index description
+_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds", "weights", "default_language")
+
+
+def _matches(spec: Index, info: Dict[str, Any]) -> bool:
+    keys = [(k, int(v) if isinstance(v, (int, float)) else v) for k, v in info.get("key", [])]
+    # text indexes are described by their weights, the key is always _fts/_ftsx
+    if not any(v == "text" for _, v in spec.keys) and keys != [(k, v) for k, v in spec.keys]:
+        return False
+    # an unset option and an explicit false are the same definition
+    return all((info.get(opt) if info.get(opt) is not False else None) == spec.options.get(opt) for opt in _OPTIONS)
+
+
+def check(collections: Optional[List[str]] = None) -> Dict[str, Dict[str, List[str]]]:
+    """Per collection: missing, conflicting and extra index names"""
+    if database.db is None:
+        raise database.DatabaseUnavailable("Database not available.")
+    report = {}
+    for collection in collections or REGISTRY:
+        existing = database.db[collection].index_information()
+        declared = {spec.name for spec in REGISTRY.get(collection, [])}
+        entry = {"missing": [], "conflict": [], "extra": []}
+        for spec in REGISTRY.get(collection, []):
+            if spec.name not in existing:
+                entry["missing"].append(spec.name)
+            elif not _matches(spec, existing[spec.name]):
+                entry["conflict"].append(spec.name)
+        entry["extra"] = sorted(name for name in existing if name != "_id_" and name not in declared)
+        report[collection] = entry
+    return report
+
+
+def apply(collections: Optional[List[str]] = None, rebuild: bool = False, drop_extra: bool = False) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Create missing indexes (and optionally rebuild conflicts / drop extras).
+    Returns the check report before applying, plus per collection the
+    indexes that could not be created or dropped ("failed": "name: error").
+    One failing index does not stop the others.
+    """
+    report = check(collections)
+    for collection, entry in report.items():
+        specs = {spec.name: spec for spec in REGISTRY.get(collection, [])}
+        entry["failed"] = []
+        for name in entry["conflict"] if rebuild else []:
+            try:
+                database.db[collection].drop_index(name)
+            except Exception as e:
+                entry["failed"].append(f"{name}: {e}")
+        for name in entry["missing"] + (entry["conflict"] if rebuild else []):
+            spec = specs[name]
+            try:
+                database.create_index(collection, spec.keys, name=spec.name, **spec.options)
+            except Exception as e:
+                entry["failed"].append(f"{name}: {e}")
+        for name in entry["extra"] if drop_extra else []:
+            try:
+                database.db[collection].drop_index(name)
+            except Exception as e:
+                entry["failed"].append(f"{name}: {e}")
+    return report
+
+
+def ensure(collection: str, name: str):
+    """Create one registered index if it does not exist"""
+    spec = next(spec for spec in REGISTRY[collection] if spec.name == name)
+    return database.create_index(collection, spec.keys, name=spec.name, **spec.options)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index registry maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    c = sub.add_parser("check", help="Report missing, conflicting and extra indexes")
+    c.add_argument("--collection", action="append")
+    a = sub.add_parser("apply", help="Create missing indexes")
+    a.add_argument("--collection", action="append")
+    a.add_argument("--rebuild", action="store_true", help="Drop and recreate indexes whose definition changed")
+    a.add_argument("--drop-extra", action="store_true", help="Drop indexes that are not in the registry")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        report = check(args.collection)
+        print(report)
+        sys.exit(1 if any(e["missing"] or e["conflict"] for e in report.values()) else 0)
+    if args.command == "apply":
+        report = apply(args.collection, rebuild=args.rebuild, drop_extra=args.drop_extra)
+        print(report)
+        sys.exit(1 if any(e["failed"] for e in report.values()) else 0)
@@ -0,0 +1,186 @@
+"""
+Ingestion helpers
+
+Shared preparation and write stage used by the /ingest endpoints.
+"""
+
+from typing import List, Dict, Any, Tuple, Optional
+
+from pydantic import TypeAdapter, ValidationError, WrapValidator
+from typing_extensions import Annotated
+
+from schemas import Listing
+from bson.errors import InvalidDocument
+from pymongo.errors import WriteError, DocumentTooLarge
+
+from database import upsert_document, bulk_upsert_documents, UpsertResult, CREATED, UPDATED, UNCHANGED, FAILED
+from dedup import build_dedup_key, content_fingerprint
+import neardup
+import enrich
+import pricing
+import bloom
+import search_index
+import deadletter
+import spool
+
+SOURCES = {"facebook", "tayara", "tunisie-annonces", "other"}
+
+class _Invalid:
+    __slots__ = ("errors",)
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        self.errors = errors
+
+
+def _capture_errors(value: Any, handler) -> Any:
+    # keep validating the rest of the batch when one item fails
+    try:
+        return handler(value)
+    except ValidationError as e:
+        return _Invalid([
+            {"loc": ".".join(map(str, err["loc"])), "msg": err["msg"]}
+            for err in e.errors(include_url=False, include_input=False)
+        ])
+
+
+# Compiled once and reused for every batch
+LISTINGS = TypeAdapter(List[Annotated[Listing, WrapValidator(_capture_errors)]])
+
+
+def _stringify_urls(doc: Dict[str, Any]) -> Dict[str, Any]:
+    if doc.get('url') is not None:
+        doc['url'] = str(doc['url'])
+    if doc.get('images'):
+        doc['images'] = [str(u) for u in doc['images']]
+    return doc
+
+
+def listing_document(listing: Listing, exclude_unset: bool = False) -> Dict[str, Any]:
+    """Mongo document for a validated listing (URLs stored as plain strings).
+    Fields computed by enrichment are left out; only enrich.py sets them."""
+    return _stringify_urls(listing.model_dump(exclude_unset=exclude_unset, exclude=enrich.DERIVED_FIELDS))
+
+
+def validate_items(items: List[Any], source: str) -> Tuple[List[Tuple[int, Dict[str, Any]]], List[Dict[str, Any]]]:
+    """
+    Validate a whole batch against schemas.Listing in one adapter pass.
+    Returns (valid, invalid): valid is a list of (index, document) and invalid a
+    list of {"index", "errors"} for items that were rejected.
+    Only fields the item actually carries are kept, so re-ingesting does not
+    reset defaults such as moderation status; fields computed by enrichment
+    (enrich.DERIVED_FIELDS) are dropped.
+    """
+    tagged = [{**item, 'source': source} if isinstance(item, dict) else item for item in items]
+    indexes, models, invalid = [], [], []
+    for i, result in enumerate(LISTINGS.validate_python(tagged)):
+        if isinstance(result, _Invalid):
+            invalid.append({"index": i, "errors": result.errors})
+        else:
+            indexes.append(i)
+            models.append(result)
+    # Listing has no nested models, so the set fields can be read off directly
+    docs = [_stringify_urls({k: m.__dict__[k] for k in m.model_fields_set - enrich.DERIVED_FIELDS}) for m in models]
+    return list(zip(indexes, docs)), invalid
+
+
+def prepare_item(item: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """Tag a raw scraper item with its source and dedup key"""
+    item = dict(item)
+    item['source'] = source
+    item['dedup_key'] = build_dedup_key(item)
+    return item
+
+
+def write_items(docs: List[Dict[str, Any]], dead_letter: bool = True, replay: bool = False) -> List[UpsertResult]:
+    """Upsert prepared listings. Returns UpsertResults aligned with `docs`, status
+    being created, updated, unchanged (same content fingerprint, not written) or
+    failed. Failed items are stored in the dead-letter collection.
+    With `replay` (spooled batches), listings that come back unchanged also get
+    the steps that follow a write: the outage may have hit between the two."""
+    enrich.enrich_batch(docs)
+    for doc in docs:
+        doc['content_hash'] = content_fingerprint(doc)
+    neardup.annotate(docs)
+    if len(docs) == 1:
+        try:
+            results = [upsert_document("listing", {"dedup_key": docs[0]['dedup_key']}, docs[0], fingerprint_field="content_hash",
+                                       track_field=pricing.TRACK_FIELD)]
+        except (WriteError, DocumentTooLarge, InvalidDocument) as e:
+            results = [UpsertResult(None, FAILED, str(e))]
+    else:
+        # definitely-new keys skip the existing-document lookup
+        new_keys = {doc['dedup_key'] for doc in docs if not bloom.maybe_exists(doc['dedup_key'])}
+        results = bulk_upsert_documents("listing", "dedup_key", docs, fingerprint_field="content_hash", new_keys=new_keys,
+                                        track_field=pricing.TRACK_FIELD)
+    pricing.record_changes(docs, results)
+    cluster_ids = [r.id if r.status == CREATED else None for r in results]
+    refresh = [r.id for r in results if r.status in (CREATED, UPDATED)]
+    if replay:
+        unchanged = [r.id for r in results if r.status == UNCHANGED]
+        pricing.recover_changes(unchanged)
+        unclustered = neardup.unclustered([r.id for r in results if r.status in (UPDATED, UNCHANGED)])
+        cluster_ids = [r.id if r.status == CREATED or r.id in unclustered else None for r in results]
+        refresh += unchanged
+
+    failed = [(doc, r.error) for doc, r in zip(docs, results) if r.status == FAILED]
+    if failed and dead_letter:
+        deadletter.record([doc for doc, _ in failed], [error for _, error in failed])
+    bloom.seen_keys.update(doc['dedup_key'] for doc, r in zip(docs, results) if r.status != FAILED)
+    # cluster new listings with near-duplicates from other posts/sources
+    neardup.assign_clusters(docs, cluster_ids)
+    search_index.refresh(refresh)
+    return results
+
+
+def summarize(results: List[UpsertResult], indexes: List[int] = None, total: int = None) -> Dict[str, Any]:
+    """Counts per status plus per-item ids and statuses. With `indexes`, results
+    are placed at those positions of a `total`-long list; other positions were
+    rejected by validation."""
+    if indexes is None:
+        indexes, total = list(range(len(results))), len(results)
+    counts = {CREATED: 0, UPDATED: 0, UNCHANGED: 0, FAILED: 0}
+    ids: List[Optional[str]] = [None] * total
+    statuses = ["invalid"] * total
+    failures = []
+    for i, r in zip(indexes, results):
+        counts[r.status] += 1
+        ids[i], statuses[i] = r.id, r.status
+        if r.status == FAILED:
+            failures.append({"index": i, "error": r.error})
+    return {**counts, "ids": ids, "statuses": statuses, "failures": failures}
+
+
+def write_or_spool(docs: List[Dict[str, Any]], source: str) -> List[UpsertResult]:
+    """write_items, falling back to the local spool when the database is
+    unreachable. Docs are written spool.RECORD_DOCS at a time and an outage
+    spools only the slices not yet done, so the results cover a prefix of
+    `docs` (shorter than `docs` when the rest was spooled). While a spool
+    backlog exists, batches are spooled directly to keep arrival order."""
+    results: List[UpsertResult] = []
+    if not spool.has_backlog():
+        for start in range(0, len(docs), spool.RECORD_DOCS):
+            try:
+                results.extend(write_items(docs[start:start + spool.RECORD_DOCS]))
+            except spool.OUTAGE_ERRORS:
+                break
+    if len(results) < len(docs):
+        spool.append(source, docs[len(results):])
+    return results
+
+
+def ingest_batch(items: List[Any], source: str, spool_on_outage: bool = True) -> Dict[str, Any]:
+    """Validate, key and write a batch of raw scraper items"""
+    valid, invalid = validate_items(items, source)
+    docs = [prepare_item(doc, source) for _, doc in valid]
+    if not docs:
+        results = []
+    elif spool_on_outage:
+        results = write_or_spool(docs, source)
+    else:
+        results = write_items(docs)
+
+    indexes = [i for i, _ in valid]
+    summary = summarize(results, indexes[:len(results)], len(items))
+    for i in indexes[len(results):]:
+        summary["statuses"][i] = "spooled"
+    return {**summary, "spooled": len(docs) - len(results), "invalid": invalid}
@@ -0,0 +1,151 @@
+"""
+Ingestion Job Queue
+
+Durable queue of ingest batches stored in the "ingestjob" collection.
+Endpoints enqueue a job and return immediately; a pool of background
+worker threads claims queued jobs and drains them through the bulk write
+path. Jobs left "running" by a crashed worker are reclaimed once their
+lease expires.
+
+The listings of a job are stored apart, in ordered chunks of at most
+CHUNK_DOCS listings / CHUNK_BYTES of BSON ("ingestjob_items"), so a large
+batch never hits the 16 MB document limit. Chunks are deleted once the
+job is done; a TTL removes those of jobs that never finish.
+"""
+
+import os
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import List, Dict, Any, Optional, Iterator
+
+import bson
+from bson import ObjectId
+from pymongo import InsertOne, DeleteMany
+
+from database import create_document, get_document_by_id, claim_document, update_by_id, iter_documents, bulk_write_documents
+from ingest import write_items, summarize
+
+COLLECTION = "ingestjob"
+ITEMS_COLLECTION = "ingestjob_items"
+CHUNK_DOCS = 1000
+CHUNK_BYTES = 8 * 1024 * 1024
+ITEMS_TTL_SECONDS = int(os.getenv("INGEST_JOB_ITEMS_TTL_SECONDS", 7 * 24 * 3600))
+WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+POLL_SECONDS = float(os.getenv("INGEST_POLL_SECONDS", 1.0))
+LEASE_SECONDS = int(os.getenv("INGEST_LEASE_SECONDS", 300))
+MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", 3))
+
+_wakeup = threading.Event()
+_stopping = threading.Event()
+_threads: List[threading.Thread] = []
+
+
+def _chunks(docs: List[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    chunk, size = [], 0
+    for doc in docs:
+        doc_size = len(bson.encode(doc))
+        if chunk and (len(chunk) >= CHUNK_DOCS or size + doc_size > CHUNK_BYTES):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(doc)
+        size += doc_size
+    if chunk:
+        yield chunk
+
+
+def enqueue(source: str, docs: List[Dict[str, Any]]) -> str:
+    """Persist a batch of prepared listings as a queued job. Returns the job id."""
+    job_id = ObjectId()
+    now = datetime.now(timezone.utc)
+    # items first: a job is only claimable once all of its chunks exist
+    bulk_write_documents(ITEMS_COLLECTION, [
+        InsertOne({"job_id": job_id, "seq": seq, "items": chunk, "created_at": now})
+        for seq, chunk in enumerate(_chunks(docs))
+    ], ordered=True)
+    create_document(COLLECTION, {
+        "_id": job_id,
+        "source": source,
+        "status": "queued",
+        "attempts": 0,
+        "total": len(docs),
+    })
+    _wakeup.set()
+    return str(job_id)
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Job status without the queued payload"""
+    return get_document_by_id(COLLECTION, job_id, {"items": 0})
+
+
+def _claim(worker: str) -> Optional[Dict[str, Any]]:
+    now = datetime.now(timezone.utc)
+    return claim_document(
+        COLLECTION,
+        {"$or": [
+            {"status": "queued"},
+            {"status": "running", "lease_until": {"$lt": now}},
+        ]},
+        {"status": "running", "worker": worker, "started_at": now,
+         "lease_until": now + timedelta(seconds=LEASE_SECONDS)},
+        sort=[["created_at", 1]],
+    )
+
+
+def process(job: Dict[str, Any]):
+    job_id = str(job["_id"])
+    attempts = job.get("attempts", 0) + 1
+    try:
+        # a retried job rewrites its earlier chunks, which come back unchanged
+        results = write_items(job["items"]) if job.get("items") else []
+        for chunk in iter_documents(ITEMS_COLLECTION, {"job_id": job["_id"]}, {"items": 1}, sort=[["seq", 1]], batch_size=1):
+            results.extend(write_items(chunk["items"]))
+    except Exception as e:
+        status = "queued" if attempts < MAX_ATTEMPTS else "failed"
+        update_by_id(COLLECTION, job_id, {"status": status, "attempts": attempts, "error": str(e)[:500]})
+        return
+    update_by_id(COLLECTION, job_id, {
+        **summarize(results),
+        "status": "done",
+        "attempts": attempts,
+        "error": None,
+        "finished_at": datetime.now(timezone.utc),
+        # jobs queued before items moved to their own collection
+        **({"items": None} if "items" in job else {}),
+    })
+    bulk_write_documents(ITEMS_COLLECTION, [DeleteMany({"job_id": job["_id"]})])
+
+
+def _worker_loop(name: str):
+    while not _stopping.is_set():
+        try:
+            job = _claim(name)
+        except Exception:
+            job = None
+        if job is None:
+            _wakeup.wait(POLL_SECONDS)
+            _wakeup.clear()
+            continue
+        try:
+            process(job)
+        except Exception:
+            # status update failed; the lease lets another worker retry the job
+            pass
+
+
+def start_workers(count: int = WORKERS):
+    if _threads:
+        return
+    _stopping.clear()
+    for i in range(count):
+        t = threading.Thread(target=_worker_loop, args=(f"{os.getpid()}-{i}",), name=f"ingest-worker-{i}", daemon=True)
+        t.start()
+        _threads.append(t)
+
+
+def stop_workers():
+    _stopping.set()
+    _wakeup.set()
+    for t in _threads:
+        t.join(timeout=5)
+    _threads.clear()
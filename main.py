@@ -1,12 +1,28 @@
 import os
-from fastapi import FastAPI, HTTPException, Query, Body
+from fastapi import FastAPI, HTTPException, Query, Request, Header, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
+from bson import ObjectId
 
-from database import db, create_document, get_documents, upsert_document, update_by_id, aggregate
+from database import db, create_document, get_documents, get_document_by_id, update_by_id, aggregate
 from schemas import Listing, SavedSearch, Alert
+from ingest import SOURCES, listing_document, validate_items, prepare_item, write_or_spool, ingest_batch
+from dedup import build_dedup_key
+from geocode import place_filter, place_name
+import pricing
+import indexes
+import search
+import search_index
+import paging
+import jobs
+import bloom
+import idempotency
+import spool
+from payloads import read_body, decode_payload, iter_body, is_msgpack, loads_json, msgpack, MAX_BODY_BYTES
 
 app = FastAPI(title="Tunisia Real Estate Aggregator API")
 
@@ -16,8 +32,97 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+@app.on_event("startup")
+def start_background_workers():
+    if db is not None:
+        try:
+            report = indexes.apply()
+            for collection, entry in report.items():
+                for failure in entry["failed"]:
+                    print(f"Could not create index on {collection}: {failure}")
+                if entry["conflict"] or entry["extra"]:
+                    print(f"Indexes on {collection} differ from the registry: {entry} (see indexes.py)")
+        except Exception as e:
+            print(f"Could not create indexes: {e}")
+        bloom.warm_in_background()
+        search_index.start()
+        jobs.start_workers()
+        spool.start_replayer()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    jobs.stop_workers()
+    search_index.stop()
+    spool.stop_replayer()
+
+def serialize_doc(d: Dict[str, Any]) -> Dict[str, Any]:
+    """Make a Mongo document JSON friendly: id string, ISO datetimes, hex digests"""
+    if "_id" in d:
+        d["id"] = str(d.pop("_id"))
+    for key, val in list(d.items()):
+        if isinstance(val, datetime):
+            d[key] = val.isoformat()
+        elif isinstance(val, bytes):
+            d[key] = val.hex()
+        elif isinstance(val, ObjectId):
+            d[key] = str(val)
+    return d
+
+# Internal ingest bookkeeping never returned by the API
+HIDDEN_FIELDS = {"minhash": 0, "lsh_bands": 0, "search_ar": 0}
+COLLAPSE_OVERFETCH = 4
+# /api/listings?view=summary: what the result grid shows (one thumbnail, no description);
+# the full document comes from GET /api/listings/{id}
+SUMMARY_FIELDS = ["title", "price", "currency", "city", "bedrooms", "surface_m2", "deal_type",
+                  "property_type", "images", "posted_at", "source", "url"]
+LISTING_FIELDS = (set(Listing.model_fields) | {"created_at", "updated_at", "cluster_id", pricing.CHANGE_FIELD}) - set(HIDDEN_FIELDS)
+# largest _id $in batch when filtering search_index rankings in Mongo
+SEARCH_CHUNK_MAX = 5000
+# /api/listings sort orders; newest keeps undated listings after dated ones.
+# relevance (the default with a keyword query) ranks by text score.
+# Every order ends on _id so cursors (paging.py) point at a unique position.
+SORTS = {
+    "relevance": [["score", search.SCORE], ["posted_at", -1], ["created_at", -1], ["_id", -1]],
+    "newest": [["posted_at", -1], ["created_at", -1], ["_id", -1]],
+    "price_asc": [["price_tnd", 1], ["created_at", -1], ["_id", -1]],
+    "price_desc": [["price_tnd", -1], ["created_at", -1], ["_id", -1]],
+    "price_m2_asc": [["price_per_m2", 1], ["created_at", -1], ["_id", -1]],
+    "price_m2_desc": [["price_per_m2", -1], ["created_at", -1], ["_id", -1]],
+}
+
+def listing_projection(view: str, fields: Optional[str], sort_order: List[List[Any]], extra: List[str] = ()) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Mongo projection for a listings page, plus the fields it includes only for
+    sorting, cursors or collapsing, to drop before responding.
+    """
+    if fields:
+        # the id is always returned
+        wanted = [f.strip() for f in fields.split(",") if f.strip() and f.strip() != "id"]
+        unknown = sorted(set(wanted) - LISTING_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    elif view == "summary":
+        wanted = SUMMARY_FIELDS
+    else:
+        return dict(HIDDEN_FIELDS), []
+    projection: Dict[str, Any] = {f: 1 for f in wanted}
+    if "images" in projection:
+        projection["images"] = {"$slice": 1} if not fields else 1
+    internal = [f for f, _ in sort_order if f not in ("_id", "score")] + list(extra)
+    for f in internal:
+        projection.setdefault(f, 1)
+    return projection, [f for f in internal if f not in wanted]
+
+def respond(status_code: int, body: Any, replayed: bool = False):
+    """JSON response for handlers returning (status_code, body)"""
+    if status_code == 200 and not replayed:
+        return body
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    return JSONResponse(status_code=status_code, content=body, headers=headers)
+
 class CreateListing(BaseModel):
     # Allows internal ingestion via API (webhooks, scrapers)
     listing: Listing
@@ -54,25 +159,56 @@ def test_database():
         response["database"] = f"❌ Error: {str(e)[:80]}"
     return response
 
+@app.get("/api/metrics", response_model=dict)
+def metrics():
+    """Per-process ingest metrics"""
+    return {"pid": os.getpid(), "dedup_bloom": bloom.stats(), "search_index": search_index.stats(), "ingest_spool": spool.stats()}
+
 # ---------------------------
 # Listings: Create + List
 # ---------------------------
 @app.post("/api/listings", response_model=dict)
-def create_listing(payload: CreateListing):
+def create_listing(
+    payload: CreateListing,
+    defer: bool = Query(False, description="Queue the write and return 202 with a job id"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    def handler():
+        try:
+            # Create dedup key (url OR title+price+posted_at)
+            l = listing_document(payload.listing)
+            dedup_key = build_dedup_key(l)
+            l['dedup_key'] = dedup_key
+            if defer:
+                job_id = _enqueue_or_spool(l['source'], [l])
+                return 202, {"job_id": job_id, "status": "queued" if job_id else "spooled"}
+            # Upsert by dedup_key
+            results = write_or_spool([l], l['source'])
+            if not results:
+                return 202, {"id": None, "created": False, "status": "spooled"}
+            [result] = results
+            if result.status == "failed":
+                raise HTTPException(status_code=500, detail=result.error)
+            return 200, {"id": result.id, "created": result.status == "created", "status": result.status}
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    if not idempotency_key:
+        return respond(*handler())
+    digest = idempotency.request_digest(payload.model_dump_json().encode())
     try:
-        # Create dedup key (url OR title+price+posted_at)
-        l = payload.listing.model_dump()
-        dedup_key = l.get('url') or f"{l.get('title','')}-{l.get('price','')}-{l.get('posted_at','')}"
-        l['dedup_key'] = dedup_key
-        # Upsert by dedup_key
-        _id, is_new = upsert_document("listing", {"dedup_key": dedup_key}, l)
-        return {"id": _id, "created": is_new}
+        return respond(*idempotency.run("listing:create", idempotency_key, digest, handler))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/listings", response_model=List[dict])
 def list_listings(
-    q: Optional[str] = Query(None, description="Search in title/description"),
+    response: Response,
+    q: Optional[str] = Query(None, description="Keywords searched in title, city and description"),
     city: Optional[str] = Query(None),
     deal_type: Optional[str] = Query(None, regex="^(rent|sale)$"),
     property_type: Optional[str] = Query(None),
@@ -81,26 +217,65 @@ def list_listings(
     min_rooms: Optional[int] = Query(None, ge=0),
     max_rooms: Optional[int] = Query(None, ge=0),
     source: Optional[str] = Query(None),
-    limit: int = Query(50, ge=1, le=200)
+    min_price_m2: Optional[float] = Query(None, ge=0, description="Minimum price per m² in TND"),
+    max_price_m2: Optional[float] = Query(None, ge=0, description="Maximum price per m² in TND"),
+    price_dropped: bool = Query(False, description="Only listings whose last price change was a drop"),
+    sort: Optional[str] = Query(None, regex="^(" + "|".join(SORTS) + ")$", description="Default: relevance with q, else newest"),
+    collapse: bool = Query(False, description="Show one listing per near-duplicate cluster"),
+    view: str = Query("summary", regex="^(summary|full)$", description="summary: grid fields only; full: whole documents"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return (overrides view)"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=200),
 ):
     try:
         filter_dict: Dict[str, Any] = {"status": {"$ne": "rejected"}}
-        if city:
-            filter_dict["city"] = {"$regex": city, "$options": "i"}
+        city_norm = place_filter(city) if city else None
+        if city_norm is not None:
+            filter_dict["city_norm"] = city_norm
         if deal_type:
             filter_dict["deal_type"] = deal_type
         if property_type:
             filter_dict["property_type"] = property_type
         if source:
             filter_dict["source"] = source
-        # Price range
+        # Price range, in TND whatever the listing currency
         price_filter = {}
         if min_price is not None:
             price_filter["$gte"] = min_price
         if max_price is not None:
             price_filter["$lte"] = max_price
         if price_filter:
-            filter_dict["price"] = price_filter
+            filter_dict["price_tnd"] = price_filter
+        m2_filter = {}
+        if min_price_m2 is not None:
+            m2_filter["$gte"] = min_price_m2
+        if max_price_m2 is not None:
+            m2_filter["$lte"] = max_price_m2
+        if m2_filter:
+            filter_dict["price_per_m2"] = m2_filter
+        if price_dropped:
+            filter_dict[f"{pricing.CHANGE_FIELD}.delta"] = {"$lt": 0}
+        text_query = bool(q) and search.is_text_query(q)
+        after = None
+        if cursor:
+            try:
+                cursor_sort, after = paging.decode_cursor(cursor)
+            except paging.InvalidCursor as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if cursor_sort not in SORTS or sort not in (None, cursor_sort):
+                raise HTTPException(status_code=400, detail="Cursor belongs to another sort")
+            sort = cursor_sort
+        if sort is None:
+            sort = "relevance" if text_query else "newest"
+        elif sort == "relevance" and not text_query:
+            sort = "newest"
+        if sort == "relevance" and cursor:
+            # text scores are not stable positions to resume from
+            raise HTTPException(status_code=400, detail="Cursors need a sort other than relevance")
+        sort_order = SORTS[sort]
+        # price sorts leave out listings without a (convertible) price
+        if sort.startswith("price") and sort_order[0][0] not in filter_dict:
+            filter_dict[sort_order[0][0]] = {"$ne": None}
         # Rooms
         if min_rooms is not None or max_rooms is not None:
             room_filter = {}
@@ -109,23 +284,99 @@ def list_listings(
             if max_rooms is not None:
                 room_filter["$lte"] = max_rooms
             filter_dict["bedrooms"] = room_filter
-        # Full-text like search
-        if q:
-            filter_dict["$or"] = [
-                {"title": {"$regex": q, "$options": "i"}},
-                {"description": {"$regex": q, "$options": "i"}},
-                {"city": {"$regex": q, "$options": "i"}},
-            ]
+        projection, internal = listing_projection(view, fields, sort_order, ["cluster_id"] if collapse else [])
+        # Relevance ranking from the in-process index when it is loaded
+        if sort == "relevance" and search_index.ready():
+            docs = _ranked_listings(q, filter_dict, limit, collapse, projection)
+            return [serialize_doc(_without(d, internal)) for d in docs]
+        # Keyword search on the weighted text index
+        if q and q.strip():
+            filter_dict.update(search.text_filter(q))
+        if text_query:
+            projection = {**projection, "score": search.SCORE}
+        # keyset pagination: resume strictly after the previous page's last sort tuple
+        if after is not None:
+            try:
+                filter_dict = {"$and": [filter_dict, paging.after_filter(sort_order, after)]}
+            except paging.InvalidCursor as e:
+                raise HTTPException(status_code=400, detail=str(e))
 
-        docs = get_documents("listing", filter_dict, limit, sort=[["posted_at", -1], ["created_at", -1]])
-        # Serialize ObjectId and datetimes if present
-        for d in docs:
-            if "_id" in d:
-                d["id"] = str(d.pop("_id"))
-            for key, val in list(d.items()):
-                if isinstance(val, datetime):
-                    d[key] = val.isoformat()
-        return docs
+        if collapse:
+            # over-fetch, then keep the first listing of each near-duplicate cluster
+            docs, clusters = [], set()
+            for d in get_documents("listing", filter_dict, limit * COLLAPSE_OVERFETCH, sort=sort_order, projection=projection):
+                cluster = d.get("cluster_id") or d["_id"]
+                if cluster in clusters:
+                    continue
+                clusters.add(cluster)
+                docs.append(d)
+                if len(docs) >= limit:
+                    break
+        else:
+            docs = get_documents("listing", filter_dict, limit, sort=sort_order, projection=projection)
+        if len(docs) == limit and sort != "relevance":
+            response.headers["X-Next-Cursor"] = paging.encode_cursor(sort, sort_order, docs[-1])
+        # Serialize ObjectId, datetimes and binary keys if present
+        return [serialize_doc(_without(d, internal)) for d in docs]
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _without(d: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    for f in fields:
+        d.pop(f, None)
+    return d
+
+def _ranked_listings(q: str, filter_dict: Dict[str, Any], limit: int, collapse: bool, projection: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    BM25 ranking from search_index: equality filters are bitsets in the index,
+    the remaining filters run in Mongo on the ranked ids, in growing chunks,
+    until `limit` listings pass or the matches run out.
+    """
+    filter_dict = dict(filter_dict)
+    filter_dict.pop("status")
+    facets = {f: filter_dict.pop(f) for f in search_index.FACETS
+              if isinstance(filter_dict.get(f), str)}
+    ranked = search_index.search(q, facets, exclude={"status": "rejected"})
+    docs, clusters = [], set()
+    start, chunk_size = 0, limit * COLLAPSE_OVERFETCH
+    while start < len(ranked):
+        chunk = ranked[start:start + chunk_size]
+        start += len(chunk)
+        # selective range filters need many candidates: double the batch each round
+        chunk_size = min(chunk_size * 2, SEARCH_CHUNK_MAX)
+        found = {d["_id"]: d for d in get_documents("listing", {**filter_dict, "_id": {"$in": [i for i, _ in chunk]}},
+                                                    projection=projection)}
+        for _id, score in chunk:
+            d = found.get(_id)
+            if d is None:
+                continue
+            if collapse:
+                cluster = d.get("cluster_id") or _id
+                if cluster in clusters:
+                    continue
+                clusters.add(cluster)
+            d["score"] = round(score, 4)
+            docs.append(d)
+            if len(docs) >= limit:
+                return docs
+    return docs
+
+@app.get("/api/listings/{listing_id}", response_model=dict)
+def get_listing(listing_id: str):
+    try:
+        doc = get_document_by_id("listing", listing_id, HIDDEN_FIELDS)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    return serialize_doc(doc)
+
+@app.get("/api/listings/{listing_id}/price-history", response_model=List[dict])
+def listing_price_history(listing_id: str, limit: int = Query(100, ge=1, le=1000)):
+    try:
+        return [serialize_doc(d) for d in pricing.history(listing_id, limit)]
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -168,6 +419,7 @@ def record_alert(alert: Alert):
 def approve_listing(listing_id: str):
     try:
         modified = update_by_id("listing", listing_id, {"status": "approved"})
+        search_index.refresh([listing_id])
         return {"updated": modified}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -176,6 +428,7 @@ def approve_listing(listing_id: str):
 def reject_listing(listing_id: str):
     try:
         modified = update_by_id("listing", listing_id, {"status": "rejected"})
+        search_index.refresh([listing_id])
         return {"updated": modified}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -187,8 +440,9 @@ def reject_listing(listing_id: str):
 def analytics_summary(city: Optional[str] = None, deal_type: Optional[str] = None, property_type: Optional[str] = None):
     try:
         match: Dict[str, Any] = {"status": {"$ne": "rejected"}}
-        if city:
-            match["city"] = {"$regex": city, "$options": "i"}
+        city_norm = place_filter(city) if city else None
+        if city_norm is not None:
+            match["city_norm"] = city_norm
         if deal_type:
             match["deal_type"] = deal_type
         if property_type:
@@ -198,20 +452,22 @@ def analytics_summary(city: Optional[str] = None, deal_type: Optional[str] = Non
             {"$match": match},
             {"$group": {
                 "_id": {
-                    "city": "$city",
+                    "city": "$city_norm",
                     "property_type": "$property_type",
                     "deal_type": "$deal_type"
                 },
                 "count": {"$sum": 1},
-                "median_price": {"$median": "$price"},
-                "avg_price": {"$avg": "$price"}
+                "median_price": {"$median": {"input": "$price_tnd", "method": "approximate"}},
+                "avg_price": {"$avg": "$price_tnd"},
+                "median_price_m2": {"$median": {"input": "$price_per_m2", "method": "approximate"}},
+                "avg_price_m2": {"$avg": "$price_per_m2"}
             }},
             {"$sort": {"count": -1}}
         ]
         results = aggregate("listing", pipeline)
         # normalize keys
         for r in results:
-            r["city"] = r.pop("_id", {}).get("city")
+            r["city"] = place_name(r.pop("_id", {}).get("city"))
             r["property_type"] = r.get("property_type") or None
         return {"groups": results}
     except Exception as e:
@@ -221,20 +477,21 @@ def analytics_summary(city: Optional[str] = None, deal_type: Optional[str] = Non
                 {"$match": match},
                 {"$group": {
                     "_id": {
-                        "city": "$city",
+                        "city": "$city_norm",
                         "property_type": "$property_type",
                         "deal_type": "$deal_type"
                     },
                     "count": {"$sum": 1},
-                    "avg_price": {"$avg": "$price"},
-                    "min_price": {"$min": "$price"},
-                    "max_price": {"$max": "$price"}
+                    "avg_price": {"$avg": "$price_tnd"},
+                    "min_price": {"$min": "$price_tnd"},
+                    "max_price": {"$max": "$price_tnd"},
+                    "avg_price_m2": {"$avg": "$price_per_m2"}
                 }},
                 {"$sort": {"count": -1}}
             ]
             results = aggregate("listing", pipeline)
             for r in results:
-                r["city"] = r.pop("_id", {}).get("city")
+                r["city"] = place_name(r.pop("_id", {}).get("city"))
             return {"groups": results, "note": "median not available; showing avg/min/max"}
         except Exception as e2:
             raise HTTPException(status_code=500, detail=str(e2))
@@ -243,31 +500,165 @@ def analytics_summary(city: Optional[str] = None, deal_type: Optional[str] = Non
 # Ingestion webhook placeholders (scrapers will call these)
 # ---------------------------
 @app.post("/ingest/{source}")
-def ingest_source(source: str, payload: Dict[str, Any] = Body(...)):
+async def ingest_source(
+    source: str,
+    request: Request,
+    defer: bool = Query(False, description="Queue the batch and return 202 with a job id"),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
     """
     Generic ingestion endpoint for connectors/scrapers.
     Accepts either a single listing or a list of listings under `items`.
-    Deduplicates using url or title+price+posted_at.
+    The body may be JSON or MessagePack, optionally gzip/zstd Content-Encoded.
+    Deduplicates on a hashed key of url or title+price+posted_at (see dedup.py).
+    Items are validated against schemas.Listing as a batch; invalid items are
+    reported by index under `invalid` and the rest are still written.
+    With `defer=true` the batch is stored in the job queue and written by background workers.
+    With an `Idempotency-Key` header, retries replay the first response without writing again.
     """
-    if source not in {"facebook", "tayara", "tunisie-annonces", "other"}:
+    if source not in SOURCES:
         raise HTTPException(status_code=400, detail="Unsupported source")
 
+    body = await read_body(request)
+    payload = decode_payload(request, body)
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Expected a listing object or {\"items\": [...]}")
     items = payload.get("items") or [payload]
-    created, updated = 0, 0
-    ids: List[str] = []
-    for it in items:
-        it = dict(it)
-        it['source'] = source
-        # build dedup key
-        dedup_key = it.get('url') or f"{it.get('title','')}-{it.get('price','')}-{it.get('posted_at','')}"
-        it['dedup_key'] = dedup_key
-        _id, is_new = upsert_document("listing", {"dedup_key": dedup_key}, it)
-        ids.append(_id)
-        if is_new:
-            created += 1
-        else:
-            updated += 1
-    return {"created": created, "updated": updated, "ids": ids}
+
+    def handler():
+        try:
+            if defer:
+                return 202, _enqueue_batch(items, source)
+            result = ingest_batch(items, source)
+            return (202 if result["spooled"] else 200), result
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    if not idempotency_key:
+        return respond(*await run_in_threadpool(handler))
+    digest = idempotency.request_digest(body)
+    try:
+        return respond(*await run_in_threadpool(idempotency.run, f"ingest:{source}", idempotency_key, digest, handler))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _enqueue_or_spool(source: str, docs: List[Dict[str, Any]]) -> Optional[str]:
+    """Queue a batch as a job; if the database is down, spool it instead (returns None)"""
+    try:
+        return jobs.enqueue(source, docs)
+    except spool.OUTAGE_ERRORS:
+        spool.append(source, docs)
+        return None
+
+def _enqueue_batch(items: List[Any], source: str) -> Dict[str, Any]:
+    valid, invalid = validate_items(items, source)
+    docs = [prepare_item(doc, source) for _, doc in valid]
+    if not docs:
+        return {"job_id": None, "status": "empty", "total": 0, "invalid": invalid}
+    job_id = _enqueue_or_spool(source, docs)
+    return {"job_id": job_id, "status": "queued" if job_id else "spooled", "total": len(docs), "invalid": invalid}
+
+@app.post("/ingest/{source}/stream")
+async def ingest_source_stream(source: str, request: Request, chunk_size: int = Query(500, ge=1, le=5000)):
+    """
+    Streaming ingestion: the body is newline-delimited JSON, one listing per line
+    (or a stream of MessagePack objects with a msgpack Content-Type), optionally
+    gzip/zstd Content-Encoded. Items are decoded as they arrive and flushed to
+    the database every `chunk_size` items, so memory stays bounded regardless
+    of upload size.
+    """
+    if source not in SOURCES:
+        raise HTTPException(status_code=400, detail="Unsupported source")
+    binary = is_msgpack(request)
+
+    chunks: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    line_no = 0
+
+    async def flush():
+        try:
+            result = await run_in_threadpool(ingest_batch, [item for _, item in batch], source)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail={"error": str(e), "chunks": chunks})
+        for invalid in result["invalid"]:
+            errors.append({"line": batch[invalid["index"]][0], "error": "validation failed", "errors": invalid["errors"]})
+        for failure in result["failures"]:
+            errors.append({"line": batch[failure["index"]][0], "error": "write failed", "detail": failure["error"]})
+        chunks.append({"chunk": len(chunks), "items": len(batch), "created": result["created"], "updated": result["updated"],
+                       "unchanged": result["unchanged"], "failed": result["failed"], "spooled": result["spooled"],
+                       "invalid": len(result["invalid"])})
+        batch.clear()
+
+    async def add(item: Any):
+        if not isinstance(item, dict):
+            errors.append({"line": line_no, "error": "expected an object"})
+            return
+        batch.append((line_no, item))
+        if len(batch) >= chunk_size:
+            await flush()
+
+    async def consume(line: bytes):
+        nonlocal line_no
+        line_no += 1
+        line = line.strip()
+        if not line:
+            return
+        try:
+            item = loads_json(line)
+        except ValueError:
+            errors.append({"line": line_no, "error": "invalid JSON"})
+            return
+        await add(item)
+
+    if binary:
+        # "line" numbers count MessagePack objects
+        unpacker = msgpack.Unpacker(raw=False, timestamp=3, max_buffer_size=MAX_BODY_BYTES)
+        async for block in iter_body(request):
+            unpacker.feed(block)
+            try:
+                for item in unpacker:
+                    line_no += 1
+                    await add(item)
+            except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+                raise HTTPException(status_code=400, detail={"error": f"Malformed MessagePack: {e}", "chunks": chunks})
+        if batch:
+            await flush()
+        return _stream_summary(chunks, errors)
+
+    pending = b""
+    async for block in iter_body(request):
+        pending += block
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            await consume(line)
+    await consume(pending)
+    if batch:
+        await flush()
+    return _stream_summary(chunks, errors)
+
+def _stream_summary(chunks: List[Dict[str, Any]], errors: List[Dict[str, Any]]):
+    return {
+        "created": sum(c["created"] for c in chunks),
+        "updated": sum(c["updated"] for c in chunks),
+        "unchanged": sum(c["unchanged"] for c in chunks),
+        "failed": sum(c["failed"] for c in chunks),
+        "spooled": sum(c["spooled"] for c in chunks),
+        "chunks": chunks,
+        "errors": errors,
+    }
+
+@app.get("/ingest/jobs/{job_id}", response_model=dict)
+def get_ingest_job(job_id: str):
+    try:
+        job = jobs.get_job(job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return serialize_doc(job)
 
 if __name__ == "__main__":
     import uvicorn
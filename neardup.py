@@ -0,0 +1,210 @@
+"""
+Near-Duplicate Detection
+
+MinHash signatures over normalized listing text plus city/price/surface
+tokens, indexed with LSH bands stored on each listing (`lsh_bands`,
+multikey-indexed). At ingest, candidates are fetched by band with one
+indexed query per batch, verified by estimated Jaccard similarity and
+price/surface agreement, and the listing joins the candidate's
+`cluster_id` (or starts its own cluster).
+
+Assign clusters to listings ingested before this existed:
+    python neardup.py backfill [--batch-size 500]
+"""
+
+import argparse
+import hashlib
+import math
+import random
+from array import array
+from typing import List, Dict, Any, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from database import iter_documents, get_documents, bulk_write_documents
+from textnorm import tokens
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+THRESHOLD = 0.6
+PRICE_TOLERANCE = 0.15
+SURFACE_TOLERANCE = 0.10
+DESCRIPTION_WORDS = 60
+MAX_CANDIDATES = 200
+
+_MASK64 = (1 << 64) - 1
+_rng = random.Random(0x5EED)
+# multiply-shift hash family: h(x) = ((a*x + b) mod 2^64) >> 32, a odd
+_PERMS = [(_rng.getrandbits(64) | 1, _rng.getrandbits(64)) for _ in range(NUM_PERM)]
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _to_int64(value: int) -> int:
+    """Fold an unsigned 64-bit value into BSON's signed int64 range"""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def shingles(doc: Dict[str, Any]) -> set:
+    words = tokens(doc.get('title'))
+    words += tokens(doc.get('description'))[:DESCRIPTION_WORDS]
+    out = set(words)
+    out.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    city = " ".join(tokens(doc.get('city')))
+    if city:
+        out.add(f"city:{city}")
+    price, surface = doc.get('price'), doc.get('surface_m2')
+    if isinstance(price, (int, float)) and price > 0:
+        out.add(f"price:{round(math.log(price, 1.1))}")
+    if isinstance(surface, (int, float)) and surface > 0:
+        out.add(f"surface:{round(math.log(surface, 1.05))}")
+    return out
+
+
+def signature(doc: Dict[str, Any]) -> Optional[List[int]]:
+    hashes = [_hash64(s) for s in shingles(doc)]
+    if not hashes:
+        return None
+    return [min(((a * h + b) & _MASK64) >> 32 for h in hashes) for a, b in _PERMS]
+
+
+def band_keys(sig: List[int]) -> List[int]:
+    keys = []
+    for band in range(BANDS):
+        chunk = sig[band * ROWS:(band + 1) * ROWS]
+        keys.append(_to_int64(_hash64(f"{band}:" + ",".join(map(str, chunk)))))
+    return keys
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+def _close(a: Any, b: Any, tolerance: float) -> bool:
+    if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+        return True
+    if a == b:
+        return True
+    return abs(a - b) <= tolerance * max(abs(a), abs(b))
+
+
+def _compatible(doc: Dict[str, Any], other: Dict[str, Any]) -> bool:
+    return _close(doc.get('price'), other.get('price'), PRICE_TOLERANCE) and \
+        _close(doc.get('surface_m2'), other.get('surface_m2'), SURFACE_TOLERANCE)
+
+
+def annotate(docs: List[Dict[str, Any]]):
+    """Attach MinHash signature and LSH band keys to prepared listings (in place)"""
+    for doc in docs:
+        sig = signature(doc)
+        if sig is None:
+            continue
+        doc['minhash'] = array('I', sig).tobytes()
+        doc['lsh_bands'] = band_keys(sig)
+
+
+def _unpack(raw: bytes) -> List[int]:
+    sig = array('I')
+    sig.frombytes(raw)
+    return sig.tolist()
+
+
+def _best_match(doc: Dict[str, Any], sig: List[int], candidates: List[Tuple[List[int], Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+    best, best_score = None, THRESHOLD
+    for cand_sig, cand in candidates:
+        score = similarity(sig, cand_sig)
+        if score >= best_score and _compatible(doc, cand):
+            best, best_score = cand, score
+    return best
+
+
+def assign_clusters(docs: List[Dict[str, Any]], ids: List[Optional[str]]) -> int:
+    """
+    Set cluster_id for freshly written listings. `ids` are aligned with `docs`;
+    entries that are None are skipped. Returns the number of listings updated.
+    """
+    pending = [(doc, ObjectId(_id)) for doc, _id in zip(docs, ids) if _id and doc.get('lsh_bands')]
+    if not pending:
+        return 0
+
+    bands = list({band for doc, _ in pending for band in doc['lsh_bands']})
+    own_ids = [oid for _, oid in pending]
+    found = get_documents(
+        "listing",
+        {"lsh_bands": {"$in": bands}, "_id": {"$nin": own_ids}, "minhash": {"$exists": True}},
+        limit=MAX_CANDIDATES * len(pending),
+        projection={"minhash": 1, "lsh_bands": 1, "cluster_id": 1, "price": 1, "surface_m2": 1},
+    )
+    by_band: Dict[int, List[Tuple[List[int], Dict[str, Any]]]] = {}
+    for cand in found:
+        entry = (_unpack(cand['minhash']), cand)
+        for band in cand.get('lsh_bands') or []:
+            by_band.setdefault(band, []).append(entry)
+
+    ops = []
+    for doc, oid in pending:
+        sig = _unpack(doc['minhash'])
+        seen, candidates = set(), []
+        for band in doc['lsh_bands']:
+            for entry in by_band.get(band, ()):
+                if id(entry[1]) not in seen:
+                    seen.add(id(entry[1]))
+                    candidates.append(entry)
+        match = _best_match(doc, sig, candidates)
+        cluster_id = (match.get('cluster_id') or match['_id']) if match else oid
+        ops.append(UpdateOne({"_id": oid}, {"$set": {"cluster_id": cluster_id}}))
+        # later items of the same batch can match this one
+        entry = (sig, {"_id": oid, "cluster_id": cluster_id, "price": doc.get('price'), "surface_m2": doc.get('surface_m2')})
+        for band in doc['lsh_bands']:
+            by_band.setdefault(band, []).append(entry)
+
+    bulk_write_documents("listing", ops)
+    return len(ops)
+
+
+def unclustered(ids: List[Optional[str]]) -> set:
+    """The listings among `ids` that have no cluster_id yet"""
+    oids = [ObjectId(i) for i in ids if i]
+    if not oids:
+        return set()
+    found = get_documents("listing", {"_id": {"$in": oids}, "cluster_id": {"$exists": False}}, projection={"_id": 1})
+    return {str(doc["_id"]) for doc in found}
+
+
+def backfill(batch_size: int = 500) -> int:
+    """Annotate and cluster listings that have no cluster_id yet, oldest first"""
+    total = 0
+    batch: List[Dict[str, Any]] = []
+    projection = {"title": 1, "description": 1, "city": 1, "price": 1, "surface_m2": 1}
+    for doc in iter_documents("listing", {"cluster_id": {"$exists": False}}, projection, sort=[["created_at", 1]]):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            total += _backfill_batch(batch)
+            batch = []
+    if batch:
+        total += _backfill_batch(batch)
+    return total
+
+
+def _backfill_batch(batch: List[Dict[str, Any]]) -> int:
+    annotate(batch)
+    bulk_write_documents("listing", [
+        UpdateOne({"_id": doc["_id"]}, {"$set": {"minhash": doc['minhash'], "lsh_bands": doc['lsh_bands']}})
+        for doc in batch if doc.get('lsh_bands')
+    ])
+    return assign_clusters(batch, [str(doc["_id"]) for doc in batch])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-duplicate clustering maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("backfill", help="Cluster listings that have no cluster_id")
+    b.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        print({"clustered": backfill(batch_size=args.batch_size)})
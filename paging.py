@@ -0,0 +1,65 @@
+"""
+Keyset Pagination
+
+Cursors for /api/listings are opaque tokens carrying the sort name and the
+sort-key values of the last listing of a page (the sort always ends on
+_id, so the tuple is unique). The next page is a range query "after that
+tuple" on the same sort, served by the matching compound index, so deep
+pages cost the same as the first one.
+
+Missing values sort first ascending and last descending, like MongoDB
+does, and range operators never match them, so null keys get their own
+branches in the filter.
+"""
+
+import base64
+from typing import List, Dict, Any, Tuple
+
+import bson
+from bson.errors import BSONError
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort: str, sort_order: List[List[Any]], doc: Dict[str, Any]) -> str:
+    """Cursor pointing just after `doc` in `sort`"""
+    values = [doc.get(field) for field, _ in sort_order]
+    raw = bson.encode({"s": sort, "v": values})
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[str, List[Any]]:
+    """Sort name and sort-key values stored in a cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        data = bson.decode(raw)
+    except (ValueError, BSONError) as e:
+        raise InvalidCursor("Malformed cursor") from e
+    if not isinstance(data.get("s"), str) or not isinstance(data.get("v"), list):
+        raise InvalidCursor("Malformed cursor")
+    return data["s"], data["v"]
+
+
+def _after(keys: List[Tuple[str, int, Any]]) -> Dict[str, Any]:
+    field, direction, value = keys[0]
+    branches = []
+    if value is None:
+        # nulls are the lowest values: first ascending, last descending
+        if direction == 1:
+            branches.append({field: {"$ne": None}})
+    else:
+        branches.append({field: {"$gt" if direction == 1 else "$lt": value}})
+        if direction == -1:
+            branches.append({field: None})
+    if len(keys) > 1:
+        branches.append({"$and": [{field: value}, _after(keys[1:])]})
+    return {"$or": branches} if branches else {"_id": {"$in": []}}
+
+
+def after_filter(sort_order: List[List[Any]], values: List[Any]) -> Dict[str, Any]:
+    """Filter matching the listings strictly after `values` in `sort_order`"""
+    if len(values) != len(sort_order):
+        raise InvalidCursor("Cursor does not match the sort")
+    return _after([(field, direction, value) for (field, direction), value in zip(sort_order, values)])
@@ -0,0 +1,159 @@
+"""
+Ingest Request Bodies
+
+Decoding for ingest request bodies: gzip/deflate and (optionally) zstd
+Content-Encoding, and JSON or (optionally) MessagePack content. Output is
+produced in bounded pieces (gzip/deflate as the body streams in, zstd once
+it has arrived) and capped at MAX_BODY_BYTES. orjson is used for JSON when
+installed. Optional packages: zstandard, msgpack, orjson.
+"""
+
+import io
+import json
+import os
+import zlib
+from typing import Any, AsyncIterator, Iterable, Iterator, Optional
+
+from fastapi import HTTPException, Request
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+# Upper bound on the decompressed size of one body (guards against compression bombs)
+MAX_BODY_BYTES = int(os.getenv("INGEST_MAX_BODY_BYTES", 256 * 1024 * 1024))
+# Decompressors produce at most this much output at a time, so the cap is
+# checked before a small compressed block can inflate any further
+CHUNK_BYTES = 256 * 1024
+MSGPACK_TYPES = {"application/msgpack", "application/x-msgpack", "application/vnd.msgpack"}
+DECODE_ERRORS = (zlib.error,) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+
+def loads_json(data: bytes) -> Any:
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def is_msgpack(request: Request) -> bool:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in MSGPACK_TYPES:
+        if msgpack is None:
+            raise HTTPException(status_code=415, detail="MessagePack bodies require the msgpack package")
+        return True
+    return False
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail="Decompressed body too large")
+
+
+class _Inflate:
+    """gzip / deflate, in pieces of at most CHUNK_BYTES"""
+
+    def __init__(self):
+        # wbits=47 auto-detects gzip and zlib headers
+        self.obj = zlib.decompressobj(wbits=47)
+
+    def feed(self, block: bytes) -> Iterable[bytes]:
+        data = self.obj.decompress(block, CHUNK_BYTES)
+        while data:
+            yield data
+            data = self.obj.decompress(self.obj.unconsumed_tail, CHUNK_BYTES)
+
+    def flush(self) -> Iterable[bytes]:
+        tail = self.obj.flush()
+        return (tail,) if tail else ()
+
+
+class _Zstd:
+    """zstd, in pieces of at most CHUNK_BYTES. The decompressobj has no output
+    limit and stream_reader takes an empty read for the end of input, so the
+    compressed body is buffered and read back once it is complete."""
+
+    def __init__(self):
+        self.compressed = io.BytesIO()
+
+    def feed(self, block: bytes) -> Iterable[bytes]:
+        if self.compressed.tell() + len(block) > MAX_BODY_BYTES:
+            raise _too_large()
+        self.compressed.write(block)
+        return ()
+
+    def flush(self) -> Iterable[bytes]:
+        self.compressed.seek(0)
+        reader = zstandard.ZstdDecompressor().stream_reader(self.compressed, read_across_frames=True)
+        while True:
+            data = reader.read(CHUNK_BYTES)
+            if not data:
+                return
+            yield data
+
+
+def _decompressor(encoding: str):
+    if encoding in ("", "identity"):
+        return None
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        return _Inflate()
+    if encoding == "zstd":
+        if zstandard is None:
+            raise HTTPException(status_code=415, detail="zstd bodies require the zstandard package")
+        return _Zstd()
+    raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+
+
+def _decode(decoder, block: Optional[bytes]) -> Iterator[bytes]:
+    """Decompressed pieces of one body block (None: end of body)"""
+    if decoder is None:
+        if block:
+            yield block
+        return
+    try:
+        yield from decoder.feed(block) if block is not None else decoder.flush()
+    except DECODE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Could not decompress body: {e}")
+
+
+async def iter_body(request: Request) -> AsyncIterator[bytes]:
+    """Yield the request body decompressed chunk by chunk"""
+    decoder = _decompressor(request.headers.get("content-encoding", "").strip().lower())
+    total = 0
+    async for block in request.stream():
+        for data in _decode(decoder, block or b""):
+            total += len(data)
+            if total > MAX_BODY_BYTES:
+                raise _too_large()
+            yield data
+    for data in _decode(decoder, None):
+        total += len(data)
+        if total > MAX_BODY_BYTES:
+            raise _too_large()
+        yield data
+
+
+async def read_body(request: Request) -> bytes:
+    """Whole request body, decompressed"""
+    return b"".join([chunk async for chunk in iter_body(request)])
+
+
+def decode_payload(request: Request, body: bytes) -> Any:
+    """Parse a decompressed body as JSON or MessagePack according to Content-Type"""
+    binary = is_msgpack(request)
+    try:
+        return msgpack.unpackb(body, raw=False, timestamp=3) if binary else loads_json(body)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Malformed request body")
+
+
+async def read_payload(request: Request) -> Any:
+    """Decode a whole (possibly compressed) JSON or MessagePack body"""
+    return decode_payload(request, await read_body(request))
@@ -0,0 +1,129 @@
+"""
+Price Normalization
+
+Converts listing prices to Tunisian dinars with a locally configured rate
+table (data/fx_rates.json, or FX_RATES_PATH) and derives price per m².
+Prices without a currency are taken to be in the table's default
+currency; unknown currencies get no price_tnd rather than a guess.
+
+Fills on each listing:
+    price_tnd       price converted to TND
+    price_per_m2    price_tnd / surface_m2, when the surface is known
+
+Price changes are tracked on price_tnd, so a listing re-posted in another
+currency is compared in dinars. Changes of re-ingested listings are
+appended to the "listing_price_history" collection ({listing_id, at, old,
+new, price, currency}; old/new in TND, price/currency as posted); the
+listing itself carries the latest one as `last_price_tnd_change`
+({old, new, at, delta}), set by the upsert that changed the price.
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+from bson import ObjectId
+from pymongo import InsertOne
+
+from database import bulk_write_documents, get_documents, aggregate, UpsertResult
+
+HISTORY_COLLECTION = "listing_price_history"
+TRACK_FIELD = "price_tnd"
+CHANGE_FIELD = f"last_{TRACK_FIELD}_change"
+
+FX_RATES_PATH = os.getenv("FX_RATES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "fx_rates.json"))
+
+_table: Optional[Dict[str, Any]] = None
+
+
+def rates() -> Dict[str, Any]:
+    global _table
+    if _table is None:
+        with open(FX_RATES_PATH, encoding="utf-8") as f:
+            table = json.load(f)
+        table["aliases"] = {k.upper(): v.upper() for k, v in (table.get("aliases") or {}).items()}
+        table["rates"] = {k.upper(): float(v) for k, v in table["rates"].items()}
+        _table = table
+    return _table
+
+
+def currency_code(currency: Optional[str]) -> Optional[str]:
+    """ISO code for a free-form currency ("DT", "€", "euros"); None when unknown"""
+    table = rates()
+    if not currency or not str(currency).strip():
+        return table.get("default_currency", "TND")
+    code = str(currency).strip().upper()
+    code = table["aliases"].get(code, code)
+    return code if code in table["rates"] else None
+
+
+def to_tnd(price: Any, currency: Optional[str]) -> Optional[float]:
+    if not isinstance(price, (int, float)) or price < 0:
+        return None
+    code = currency_code(currency)
+    if code is None:
+        return None
+    return round(price * rates()["rates"][code], 2)
+
+
+def per_m2(price_tnd: Optional[float], surface_m2: Any) -> Optional[float]:
+    if price_tnd is None or not isinstance(surface_m2, (int, float)) or surface_m2 <= 0:
+        return None
+    return round(price_tnd / surface_m2, 2)
+
+
+def enrich(docs: List[Dict[str, Any]]):
+    """Set price_tnd and price_per_m2 on listings that carry a price (in place)"""
+    for doc in docs:
+        if 'price' not in doc:
+            continue
+        doc['price_tnd'] = to_tnd(doc['price'], doc.get('currency'))
+        doc['price_per_m2'] = per_m2(doc['price_tnd'], doc.get('surface_m2'))
+
+
+def record_changes(docs: List[Dict[str, Any]], results: List[UpsertResult]) -> int:
+    """Append the price changes reported by an upsert batch to the history collection"""
+    now = datetime.now(timezone.utc)
+    ops = [
+        InsertOne({"listing_id": ObjectId(r.id), "at": now, "old": r.previous,
+                   "new": doc.get(TRACK_FIELD), "price": doc.get('price'), "currency": doc.get('currency')})
+        for doc, r in zip(docs, results) if r.previous is not None and r.id
+    ]
+    bulk_write_documents(HISTORY_COLLECTION, ops)
+    return len(ops)
+
+
+def recover_changes(ids: List[str]) -> int:
+    """Append the latest change of these listings when the history lacks it,
+    i.e. the write that made it was cut off by an outage before record_changes"""
+    oids = [ObjectId(i) for i in ids if i]
+    if not oids:
+        return 0
+    listings = get_documents("listing", {"_id": {"$in": oids}, CHANGE_FIELD: {"$exists": True}},
+                             projection={CHANGE_FIELD: 1, "price": 1, "currency": 1})
+    if not listings:
+        return 0
+    recorded = {row["_id"]: row["at"] for row in aggregate(HISTORY_COLLECTION, [
+        {"$match": {"listing_id": {"$in": [listing["_id"] for listing in listings]}}},
+        {"$group": {"_id": "$listing_id", "at": {"$max": "$at"}}},
+    ])}
+    ops = []
+    for listing in listings:
+        change = listing[CHANGE_FIELD]
+        last = recorded.get(listing["_id"])
+        # history entries are stamped after the write that set the change
+        if not isinstance(change, dict) or (last is not None and last >= change["at"]):
+            continue
+        ops.append(InsertOne({"listing_id": listing["_id"], "at": change["at"], "old": change.get("old"),
+                              "new": change.get("new"), "price": listing.get('price'), "currency": listing.get('currency')}))
+    bulk_write_documents(HISTORY_COLLECTION, ops)
+    return len(ops)
+
+
+def history(listing_id: str, limit: int = 100) -> List[Dict[str, Any]]:
+    """Price changes of one listing, newest first"""
+    if not ObjectId.is_valid(listing_id):
+        return []
+    return get_documents(HISTORY_COLLECTION, {"listing_id": ObjectId(listing_id)}, limit,
+                         sort=[["at", -1]], projection={"_id": 0, "listing_id": 0})
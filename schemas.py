@@ -12,7 +12,7 @@ Model name is converted to lowercase for the collection name:
 """
 
 from pydantic import BaseModel, Field, HttpUrl, EmailStr
-from typing import Optional, List, Literal
+from typing import Optional, List, Literal, Dict
 from datetime import datetime
 
 # SaaS: Real estate listing schema
@@ -40,11 +40,18 @@ class Listing(BaseModel):
 
     # Moderation & enrichment
     status: Literal['pending', 'approved', 'rejected'] = Field('pending', description="Moderation status")
-    dedup_key: Optional[str] = Field(None, description="Hash used to deduplicate")
+    dedup_key: Optional[bytes] = Field(None, description="Hash used to deduplicate (16-byte digest, see dedup.py)")
     lat: Optional[float] = Field(None, ge=-90, le=90)
     lng: Optional[float] = Field(None, ge=-180, le=180)
     geocoded_city: Optional[str] = None
     geocoded_area: Optional[str] = None
+    city_norm: Optional[str] = Field(None, description="Canonical city key (see geocode.place_key)")
+    area_norm: Optional[str] = Field(None, description="Canonical area key")
+    extraction: Optional[Dict[str, float]] = Field(None, description="Confidence of fields extracted from the text (see extract.py)")
+    price_tnd: Optional[float] = Field(None, ge=0, description="Price converted to TND (see pricing.py)")
+    price_per_m2: Optional[float] = Field(None, ge=0, description="price_tnd / surface_m2")
+    search_ar: Optional[str] = Field(None, description="Stemmed Arabic words for the text index (see search.py)")
+    geo_precision: Optional[Literal['source', 'locality', 'delegation', 'governorate']] = Field(None, description="Where lat/lng come from (see geocode.py)")
 
 # Minimal user model (for future authentication/ownership of saved searches)
 class User(BaseModel):
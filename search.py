@@ -0,0 +1,54 @@
+"""
+Keyword Search
+
+`q` on /api/listings runs on a weighted MongoDB text index (see the
+"listing_text" entry in indexes.py): title over city over description,
+French stemming as the default language, results sorted by relevance.
+MongoDB has no Arabic analyzer, so Arabic words of each listing are
+light-stemmed (textnorm.arabic_stem) into `search_ar`, which is part of
+the text index; Arabic query words are stemmed the same way.
+
+Queries shorter than MIN_TEXT_QUERY characters cannot be served by the
+text index (it only matches whole words), so they fall back to a
+case-insensitive prefix regex on title and city.
+
+When the in-process index (search_index.py) is loaded, relevance-sorted
+queries are ranked there instead and this text index is the fallback.
+"""
+
+import re
+from typing import List, Dict, Any
+
+from textnorm import fold, is_arabic, arabic_stem
+
+MIN_TEXT_QUERY = 3
+TEXT_WEIGHTS = {"title": 10, "city": 5, "search_ar": 3, "description": 1}
+TEXT_LANGUAGE = "french"
+SCORE = {"$meta": "textScore"}
+
+
+def arabic_terms(text: Any) -> str:
+    return " ".join(arabic_stem(w) for w in fold(text).split() if is_arabic(w))
+
+
+def index_text(docs: List[Dict[str, Any]]):
+    """Set `search_ar` from the Arabic words of title, city and description (in place)"""
+    for doc in docs:
+        if not any(f in doc for f in ("title", "city", "description")):
+            continue
+        terms = arabic_terms(" ".join(str(doc.get(f) or "") for f in ("title", "city", "description")))
+        doc['search_ar'] = terms or None
+
+
+def is_text_query(q: str) -> bool:
+    return len(q.strip()) >= MIN_TEXT_QUERY
+
+
+def text_filter(q: str) -> Dict[str, Any]:
+    """Filter clause for a keyword query: $text when possible, else a short prefix regex"""
+    if not is_text_query(q):
+        prefix = "(^|\\s)" + re.escape(q.strip())
+        return {"$or": [{"title": {"$regex": prefix, "$options": "i"}},
+                        {"city": {"$regex": prefix, "$options": "i"}}]}
+    stemmed = arabic_terms(q)
+    return {"$text": {"$search": f"{q} {stemmed}".strip(), "$language": TEXT_LANGUAGE}}
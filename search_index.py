@@ -0,0 +1,520 @@
+"""
+Listing Search Index
+
+In-process BM25 engine for /api/listings?q=, so keyword search does not
+hit the Mongo primary. Listings get dense ordinals; each token maps to a
+sorted posting array of ordinals plus field-weighted term frequencies.
+Equality filters (status, deal_type, property_type, source, city_norm)
+are bitsets over ordinals, applied before scoring.
+
+The base index is a single file (SEARCH_INDEX_PATH) that every worker
+memory-maps, so processes start warm and share pages. Changes since the
+base was built live in a per-process delta: re-indexed listings get a new
+ordinal and their base ordinal is tombstoned. The delta is fed by ingest,
+approve/reject, and a background sync of listings whose updated_at moved
+past the last seen value, which also picks up other workers' writes.
+Once the delta reaches COMPACT_DOCS listings, the sync thread rebuilds the
+base (one worker at a time, under a file lock) and every worker remaps it.
+
+File layout (little-endian):
+    b"LSIDX001" | u64 header length | JSON header | data
+The header holds counts, the sync watermark, the term dictionary
+(term -> [offset, df]) and facet bitsets (field -> value -> [offset, bytes]).
+Postings are df u32 ordinals followed by df f32 weighted frequencies;
+ids are 12-byte ObjectIds; lengths are f32.
+
+    python search_index.py build
+"""
+
+import argparse
+import fcntl
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from datetime import datetime, timezone
+from operator import itemgetter
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+from bson import ObjectId
+
+from database import iter_documents
+from textnorm import tokens, is_arabic, arabic_stem
+
+INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", os.path.join("search_index", "listing.idx"))
+ENABLED = os.getenv("SEARCH_INDEX", "on").lower() not in ("0", "off", "false", "no")
+SYNC_SECONDS = float(os.getenv("SEARCH_INDEX_SYNC_SECONDS", 10))
+# rebuild the base once the delta holds this many re-indexed listings
+COMPACT_DOCS = int(os.getenv("SEARCH_INDEX_COMPACT_DOCS", 50_000))
+
+MAGIC = b"LSIDX001"
+K1, B = 1.2, 0.75
+# BM25F-style field weights, same order as the Mongo text index (search.TEXT_WEIGHTS)
+FIELD_WEIGHTS = {"title": 3.0, "city": 2.0, "description": 1.0}
+FACETS = ("status", "deal_type", "property_type", "source", "city_norm")
+PROJECTION = {f: 1 for f in (*FIELD_WEIGHTS, *FACETS, "updated_at")}
+STOPWORDS = {"a", "au", "aux", "d", "de", "des", "du", "en", "et", "l", "la", "le", "les",
+             "un", "une", "pour", "avec", "sur", "dans", "the", "of", "and", "in", "to"}
+
+_U64 = struct.Struct("<Q")
+
+
+def analyze(text: Any) -> List[str]:
+    """Index/query tokens: folded words, Arabic light-stemmed, French plurals dropped"""
+    out = []
+    for word in tokens(text):
+        if word in STOPWORDS:
+            continue
+        if is_arabic(word):
+            word = arabic_stem(word)
+        elif len(word) > 4 and word[-1] in "sx":
+            word = word[:-1]
+        out.append(word)
+    return out
+
+
+def _terms(doc: Dict[str, Any]) -> Tuple[Dict[str, float], float]:
+    """Weighted term frequencies and weighted length of one listing"""
+    tf: Dict[str, float] = {}
+    length = 0.0
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in analyze(doc.get(field)):
+            tf[term] = tf.get(term, 0.0) + weight
+            length += weight
+    return tf, length
+
+
+def _utc(value: Any) -> Optional[datetime]:
+    # Mongo hands back naive UTC datetimes
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _set_bit(bits: bytearray, i: int):
+    if i >> 3 >= len(bits):
+        bits.extend(bytes((i >> 3) + 1 - len(bits)))
+    bits[i >> 3] |= 1 << (i & 7)
+
+
+def _clear_bit(bits: bytearray, i: int):
+    if i >> 3 < len(bits):
+        bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+
+class Segment:
+    """Read-only base index, memory-mapped"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:8] != MAGIC:
+            raise ValueError(f"{path} is not a search index")
+        (header_len,) = _U64.unpack_from(self.mm, 8)
+        self.header = json.loads(self.mm[16:16 + header_len])
+        self.data = memoryview(self.mm)[self.header["data_offset"]:]
+        self.n_docs = self.header["n_docs"]
+        self.total_len = self.header["total_len"]
+        self.terms: Dict[str, List[int]] = self.header["terms"]
+        off = self.header["ids"]
+        self.ids = self.data[off:off + 12 * self.n_docs]
+        off = self.header["lengths"]
+        self.lengths = self.data[off:off + 4 * self.n_docs].cast("f")
+        self.watermark = datetime.fromisoformat(self.header["watermark"]) if self.header.get("watermark") else None
+
+    def postings(self, term: str) -> Tuple[Any, Any]:
+        entry = self.terms.get(term)
+        if entry is None:
+            return (), ()
+        off, df = entry
+        return self.data[off:off + 4 * df].cast("I"), self.data[off + 4 * df:off + 8 * df].cast("f")
+
+    def object_id(self, ordinal: int) -> ObjectId:
+        return ObjectId(bytes(self.ids[12 * ordinal:12 * ordinal + 12]))
+
+    def facet(self, field: str, value: Any) -> bytes:
+        entry = self.header["facets"].get(field, {}).get(str(value))
+        if entry is None:
+            return b""
+        off, size = entry
+        return bytes(self.data[off:off + size])
+
+    def is_current(self) -> bool:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return (st.st_ino, st.st_mtime_ns) == (self.stat.st_ino, self.stat.st_mtime_ns)
+
+    def close(self):
+        self.lengths.release()
+        self.ids.release()
+        self.data.release()
+        self.mm.close()
+
+
+def build(path: str = INDEX_PATH, batch_size: int = 5000) -> Dict[str, Any]:
+    """Build the base index from the listing collection and atomically replace `path`"""
+    started = datetime.now(timezone.utc)
+    postings: Dict[str, Tuple[array, array]] = {}
+    ids = bytearray()
+    lengths = array("f")
+    facets: Dict[str, Dict[str, List[int]]] = {f: {} for f in FACETS}
+    watermark = None
+    n = 0
+    for doc in iter_documents("listing", {}, PROJECTION, sort=[["_id", 1]], batch_size=batch_size):
+        tf, length = _terms(doc)
+        for term, weight in tf.items():
+            entry = postings.get(term)
+            if entry is None:
+                entry = postings[term] = (array("I"), array("f"))
+            entry[0].append(n)
+            entry[1].append(weight)
+        ids += doc["_id"].binary
+        lengths.append(length)
+        for field in FACETS:
+            value = doc.get(field)
+            if value is not None:
+                facets[field].setdefault(str(value), []).append(n)
+        updated = _utc(doc.get("updated_at"))
+        if updated and (watermark is None or updated > watermark):
+            watermark = updated
+        n += 1
+
+    chunks: List[bytes] = []
+    offset = 0
+
+    def put(data: bytes) -> int:
+        nonlocal offset
+        start = offset
+        chunks.append(data)
+        offset += len(data)
+        pad = -offset % 4
+        if pad:
+            chunks.append(b"\0" * pad)
+            offset += pad
+        return start
+
+    terms = {}
+    for term in sorted(postings):
+        ords, tfs = postings[term]
+        terms[term] = [put(ords.tobytes() + tfs.tobytes()), len(ords)]
+    facet_index: Dict[str, Dict[str, List[int]]] = {}
+    for field, values in facets.items():
+        for value, ordinals in values.items():
+            bits = bytearray((n + 7) // 8)
+            for i in ordinals:
+                _set_bit(bits, i)
+            facet_index.setdefault(field, {})[value] = [put(bytes(bits)), len(bits)]
+    ids_off = put(bytes(ids))
+    lengths_off = put(lengths.tobytes())
+
+    # listings written while the build ran are picked up by the first sync
+    watermark = min(watermark, started) if watermark else started
+    header = {"version": 1, "n_docs": n, "total_len": float(sum(lengths)), "built_at": started.isoformat(),
+              "watermark": watermark.isoformat(), "terms": terms, "facets": facet_index,
+              "ids": ids_off, "lengths": lengths_off, "data_offset": 0}
+    # the data offset depends on the header length, which depends on the data offset
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    header["data_offset"] = (16 + len(encoded) + 32 + 7) // 8 * 8
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    assert 16 + len(encoded) <= header["data_offset"]
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + _U64.pack(len(encoded)) + encoded)
+        f.write(b"\0" * (header["data_offset"] - 16 - len(encoded)))
+        for chunk in chunks:
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return {"docs": n, "terms": len(terms), "bytes": os.path.getsize(path)}
+
+
+class SearchIndex:
+    """Base segment plus this process's delta"""
+
+    def __init__(self, base: Optional[Segment]):
+        self.base = base
+        self.lock = threading.RLock()
+        self.n_base = base.n_docs if base else 0
+        self.total_len = base.total_len if base else 0.0
+        self.watermark = base.watermark if base else None
+        # bitset over all ordinals
+        self.tombstones = bytearray()
+        self.n_tombstones = 0
+        # term -> base postings not tombstoned; reset whenever a base listing is re-indexed
+        self.base_df: Dict[str, int] = {}
+        self.delta_postings: Dict[str, Dict[int, float]] = {}
+        self.delta_lengths: Dict[int, float] = {}
+        self.delta_ids: List[ObjectId] = []
+        # bitsets over delta ordinals (ordinal - n_base)
+        self.delta_facets: Dict[str, Dict[str, bytearray]] = {f: {} for f in FACETS}
+        self.delta_docs: Dict[int, Tuple[Dict[str, float], Dict[str, Any]]] = {}
+        self.ordinals: Optional[Dict[ObjectId, int]] = None
+        self.versions: Dict[ObjectId, Any] = {}
+
+    @property
+    def size(self) -> int:
+        return self.n_base + len(self.delta_ids)
+
+    def _ordinals(self) -> Dict[ObjectId, int]:
+        # id -> live ordinal, built on the first update only
+        if self.ordinals is None:
+            self.ordinals = {self.base.object_id(i): i for i in range(self.n_base)} if self.base else {}
+        return self.ordinals
+
+    def _length(self, ordinal: int) -> float:
+        if ordinal < self.n_base:
+            return self.base.lengths[ordinal]
+        return self.delta_lengths[ordinal]
+
+    def _remove(self, ordinal: int):
+        _set_bit(self.tombstones, ordinal)
+        self.n_tombstones += 1
+        self.total_len -= self._length(ordinal)
+        if ordinal < self.n_base:
+            self.base_df.clear()
+        else:
+            tf, facets = self.delta_docs.pop(ordinal)
+            for term in tf:
+                self.delta_postings[term].pop(ordinal, None)
+            for field, value in facets.items():
+                _clear_bit(self.delta_facets[field][value], ordinal - self.n_base)
+            self.delta_lengths.pop(ordinal, None)
+
+    def upsert(self, docs: Iterable[Dict[str, Any]]) -> int:
+        """(Re)index listings; docs need _id, the text fields, the facets and updated_at"""
+        count = 0
+        with self.lock:
+            ordinals = self._ordinals()
+            for doc in docs:
+                _id = doc["_id"]
+                version = doc.get("updated_at")
+                if version is not None and self.versions.get(_id) == version:
+                    continue
+                old = ordinals.get(_id)
+                if old is not None:
+                    self._remove(old)
+                ordinal = self.size
+                tf, length = _terms(doc)
+                facets = {f: str(doc[f]) for f in FACETS if doc.get(f) is not None}
+                for term, weight in tf.items():
+                    self.delta_postings.setdefault(term, {})[ordinal] = weight
+                for field, value in facets.items():
+                    _set_bit(self.delta_facets[field].setdefault(value, bytearray()), ordinal - self.n_base)
+                self.delta_ids.append(_id)
+                self.delta_lengths[ordinal] = length
+                self.delta_docs[ordinal] = (tf, facets)
+                self.total_len += length
+                ordinals[_id] = ordinal
+                self.versions[_id] = version
+                updated = _utc(version)
+                if updated and (self.watermark is None or updated > self.watermark):
+                    self.watermark = updated
+                count += 1
+        return count
+
+    def _facet_bits(self, field: str, value: Any) -> int:
+        # whole-bitset int operations run in C, linear in the collection size
+        bits = int.from_bytes(self.base.facet(field, value), "little") if self.base else 0
+        delta = self.delta_facets[field].get(str(value))
+        if delta:
+            bits |= int.from_bytes(delta, "little") << self.n_base
+        return bits
+
+    def _base_df(self, term: str, base_ords: Any) -> int:
+        # the base file has no per-listing term list, so tombstoned postings are
+        # only known by scanning; counted once per term until the next removal
+        df = self.base_df.get(term)
+        if df is None:
+            dead = self.tombstones
+            size = len(dead)
+            df = sum(1 for o in base_ords if o >> 3 >= size or not dead[o >> 3] >> (o & 7) & 1)
+            self.base_df[term] = df
+        return df
+
+    @property
+    def delta_size(self) -> int:
+        return len(self.delta_ids)
+
+    def search(self, q: str, facets: Dict[str, Any] = None, exclude: Dict[str, Any] = None,
+               limit: Optional[int] = None) -> List[Tuple[ObjectId, float]]:
+        """(listing id, BM25 score) for q, best first, restricted by facet equality / exclusion"""
+        terms = list(dict.fromkeys(analyze(q)))
+        if not terms:
+            return []
+        with self.lock:
+            live = self.size - self.n_tombstones
+            if live <= 0:
+                return []
+            avgdl = self.total_len / live or 1.0
+            allowed = None
+            for field, value in (facets or {}).items():
+                bits = self._facet_bits(field, value)
+                allowed = bits if allowed is None else allowed & bits
+            blocked = int.from_bytes(self.tombstones, "little")
+            for field, value in (exclude or {}).items():
+                blocked |= self._facet_bits(field, value)
+            nbytes = (self.size + 7) // 8
+            allowed_bytes = allowed.to_bytes(nbytes, "little") if allowed is not None else None
+            blocked_bytes = blocked.to_bytes(nbytes, "little") if blocked else None
+
+            def ok(ordinal: int) -> bool:
+                if blocked_bytes is not None and blocked_bytes[ordinal >> 3] >> (ordinal & 7) & 1:
+                    return False
+                return allowed_bytes is None or bool(allowed_bytes[ordinal >> 3] >> (ordinal & 7) & 1)
+
+            scores: Dict[int, float] = {}
+            for term in terms:
+                base_ords, base_tfs = self.base.postings(term) if self.base else ((), ())
+                delta = self.delta_postings.get(term, {})
+                df = self._base_df(term, base_ords) + len(delta)
+                if not df:
+                    continue
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                for ordinal, tf in zip(base_ords, base_tfs):
+                    if ok(ordinal):
+                        norm = tf + K1 * (1 - B + B * self.base.lengths[ordinal] / avgdl)
+                        scores[ordinal] = scores.get(ordinal, 0.0) + idf * tf * (K1 + 1) / norm
+                for ordinal, tf in delta.items():
+                    if ok(ordinal):
+                        norm = tf + K1 * (1 - B + B * self.delta_lengths[ordinal] / avgdl)
+                        scores[ordinal] = scores.get(ordinal, 0.0) + idf * tf * (K1 + 1) / norm
+            top = heapq.nlargest(limit, scores.items(), key=itemgetter(1)) if limit else \
+                sorted(scores.items(), key=itemgetter(1), reverse=True)
+            return [(self.base.object_id(o) if o < self.n_base else self.delta_ids[o - self.n_base], s) for o, s in top]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_docs": self.n_base,
+            "base_terms": len(self.base.terms) if self.base else 0,
+            "base_built_at": self.base.header.get("built_at") if self.base else None,
+            "delta_docs": len(self.delta_ids),
+            "tombstones": self.n_tombstones,
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+        }
+
+
+_index: Optional[SearchIndex] = None
+_stopping = threading.Event()
+_thread: Optional[threading.Thread] = None
+_last_error: Optional[str] = None
+
+
+def ready() -> bool:
+    return _index is not None
+
+
+def _load(rebuild: bool = False):
+    """Map the base index, building it first when no worker has yet (or when `rebuild`)"""
+    global _index
+    os.makedirs(os.path.dirname(INDEX_PATH) or ".", exist_ok=True)
+    with open(INDEX_PATH + ".lock", "w") as lock:
+        # one worker builds, the others wait and map its file
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(INDEX_PATH):
+                build(INDEX_PATH)
+            # another worker may have compacted while this one waited for the lock
+            elif rebuild and (_index is None or not _index.base or _index.base.is_current()):
+                build(INDEX_PATH)
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+    old, _index = _index, SearchIndex(Segment(INDEX_PATH))
+    sync()
+    # searches in flight may still hold the old segment; its mapping is freed with it
+    del old
+
+
+def sync(batch_size: int = 1000) -> int:
+    """Index listings written since the watermark (by any process)"""
+    index = _index
+    if index is None:
+        return 0
+    query = {"updated_at": {"$gte": index.watermark}} if index.watermark else {}
+    batch, total = [], 0
+    for doc in iter_documents("listing", query, PROJECTION, sort=[["updated_at", 1]], batch_size=batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            total += index.upsert(batch)
+            batch = []
+    if batch:
+        total += index.upsert(batch)
+    return total
+
+
+def refresh(ids: Iterable[Any]) -> int:
+    """Re-index specific listings now (after ingest or moderation in this process)"""
+    if _index is None:
+        return 0
+    oids = [ObjectId(i) if not isinstance(i, ObjectId) else i for i in ids if i]
+    if not oids:
+        return 0
+    return _index.upsert(iter_documents("listing", {"_id": {"$in": oids}}, PROJECTION))
+
+
+def search(q: str, facets: Dict[str, Any] = None, exclude: Dict[str, Any] = None, limit: Optional[int] = None) -> List[Tuple[ObjectId, float]]:
+    return _index.search(q, facets, exclude, limit) if _index is not None else []
+
+
+def _sync_loop():
+    global _last_error
+    while True:
+        try:
+            if _index is None or not _index.base or not _index.base.is_current():
+                _load()
+            elif _index.delta_size >= COMPACT_DOCS:
+                # fold the delta into a fresh base so it stops growing
+                _load(rebuild=True)
+            else:
+                sync()
+            _last_error = None
+        except Exception as e:
+            _last_error = str(e)[:500]
+        if _stopping.wait(SYNC_SECONDS):
+            return
+
+
+def start():
+    """Load (or build) the index and keep it in sync in a background thread"""
+    global _thread
+    if not ENABLED or _thread is not None:
+        return
+    _stopping.clear()
+    _thread = threading.Thread(target=_sync_loop, name="search-index-sync", daemon=True)
+    _thread.start()
+
+
+def stop():
+    global _thread
+    _stopping.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
+
+
+def stats() -> Dict[str, Any]:
+    return {"enabled": ENABLED, "ready": ready(), "path": INDEX_PATH, "last_error": _last_error,
+            **(_index.stats() if _index is not None else {})}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Listing search index maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="Rebuild the base index file; running workers pick it up on their next sync")
+    b.add_argument("--path", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start_time = time.monotonic()
+        print({**build(args.path), "seconds": round(time.monotonic() - start_time, 2)})
@@ -0,0 +1,257 @@
+"""
+Ingest Spool
+
+Local append-only spool for ingest batches that cannot reach MongoDB.
+When a write fails because the database is unreachable, the part of the
+batch not yet written is appended to this process's spool file and
+acknowledged as "spooled"; while a backlog exists, new batches are spooled
+too so the database sees them in arrival order. A background replayer
+drains the spool through the regular bulk write path once the database is
+back, finishing the post-write steps of listings the interrupted write
+had already stored.
+
+Each process owns one file (INGEST_SPOOL_DIR/ingest-<pid>.spool), held
+with an exclusive flock. Files left by dead processes are adopted and
+drained by any live replayer.
+
+Record format: <u32 length><u32 crc32><BSON {source, docs, spooled_at}>.
+The replay position is kept in <file>.offset.
+"""
+
+import fcntl
+import glob
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+
+import bson
+from pymongo.errors import ConnectionFailure
+
+SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "spool")
+REPLAY_SECONDS = float(os.getenv("INGEST_SPOOL_REPLAY_SECONDS", 5))
+RECORD_DOCS = 1000  # keeps each record well under the BSON size limit
+
+# connection failures only: a missing DATABASE_URL/DATABASE_NAME (DatabaseUnavailable)
+# never recovers in a running process, so those writes fail instead of spooling
+OUTAGE_ERRORS = (ConnectionFailure,)
+
+_HEADER = struct.Struct("<II")
+
+
+class Spool:
+    """One spool file plus its persisted replay offset"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.lock = threading.Lock()
+        self.file = open(path, "ab+")
+        try:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            raise
+        self.offset = self._load_offset()
+        self.pending_records = sum(1 for _ in self._scan(self.offset))
+        self.oldest_spooled_at: Optional[datetime] = None
+
+    def _load_offset(self) -> int:
+        try:
+            with open(self.offset_path) as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _save_offset(self):
+        tmp = self.offset_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(self.offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.offset_path)
+
+    def size(self) -> int:
+        return os.fstat(self.file.fileno()).st_size
+
+    def append(self, source: str, docs: List[Dict[str, Any]]):
+        now = datetime.now(timezone.utc)
+        with self.lock:
+            for start in range(0, len(docs), RECORD_DOCS):
+                payload = bson.encode({"source": source, "docs": docs[start:start + RECORD_DOCS], "spooled_at": now})
+                self.file.write(_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+                self.pending_records += 1
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            if self.oldest_spooled_at is None:
+                self.oldest_spooled_at = now
+
+    def _scan(self, offset: int):
+        """Yield (record, next_offset) from offset; stops at a torn or corrupt tail"""
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    return
+                length, crc = _HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return
+                offset += _HEADER.size + length
+                yield bson.decode(payload, codec_options=bson.CodecOptions(tz_aware=True)), offset
+
+    def next_record(self) -> Optional[Tuple[Dict[str, Any], int]]:
+        with self.lock:
+            for record, next_offset in self._scan(self.offset):
+                self.oldest_spooled_at = record.get("spooled_at")
+                return record, next_offset
+        return None
+
+    def advance(self, next_offset: int):
+        with self.lock:
+            self.offset = next_offset
+            self.pending_records = max(0, self.pending_records - 1)
+            if self.pending_records == 0:
+                self.oldest_spooled_at = None
+                # fully drained: start the file over
+                if self.offset >= self.size():
+                    self.file.truncate(0)
+                    self.offset = 0
+            self._save_offset()
+
+    def has_backlog(self) -> bool:
+        return self.pending_records > 0
+
+    def close(self, remove: bool = False):
+        if remove:
+            for path in (self.path, self.offset_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+
+
+_own: Optional[Spool] = None
+_own_lock = threading.Lock()
+_stopping = threading.Event()
+_thread: Optional[threading.Thread] = None
+_replayed_records = 0
+_last_error: Optional[str] = None
+_last_replay_at: Optional[datetime] = None
+
+
+def _spool() -> Spool:
+    global _own
+    with _own_lock:
+        if _own is None:
+            os.makedirs(SPOOL_DIR, exist_ok=True)
+            _own = Spool(os.path.join(SPOOL_DIR, f"ingest-{os.getpid()}.spool"))
+        return _own
+
+
+def append(source: str, docs: List[Dict[str, Any]]):
+    """Durably spool a prepared batch for later replay"""
+    _spool().append(source, docs)
+
+
+def has_backlog() -> bool:
+    return _own is not None and _own.has_backlog()
+
+
+def drain(spool: Spool) -> bool:
+    """Replay records until the spool is empty (True) or the database is down (False)"""
+    from ingest import write_items
+    import deadletter
+
+    global _replayed_records, _last_error, _last_replay_at
+    while not _stopping.is_set():
+        entry = spool.next_record()
+        if entry is None:
+            return True
+        record, next_offset = entry
+        docs = record.get("docs") or []
+        try:
+            write_items(docs, replay=True)
+        except OUTAGE_ERRORS as e:
+            _last_error = str(e)[:500]
+            return False
+        except Exception as e:
+            # not an outage: park the batch in the dead-letter collection instead of blocking the spool
+            _last_error = str(e)[:500]
+            try:
+                deadletter.record(docs, [f"spool replay: {e}"] * len(docs))
+            except OUTAGE_ERRORS:
+                return False
+        spool.advance(next_offset)
+        _replayed_records += 1
+        _last_replay_at = datetime.now(timezone.utc)
+    return False
+
+
+def _adopt_orphans():
+    """Drain spool files left behind by processes that are gone"""
+    own_path = _own.path if _own is not None else None
+    for path in glob.glob(os.path.join(SPOOL_DIR, "*.spool")):
+        if path == own_path:
+            continue
+        try:
+            orphan = Spool(path)
+        except (BlockingIOError, OSError):
+            continue  # owned by a live process
+        drained = False
+        try:
+            drained = drain(orphan)
+        finally:
+            orphan.close(remove=drained)
+
+
+def _replay_loop():
+    while not _stopping.wait(REPLAY_SECONDS):
+        try:
+            if has_backlog():
+                drain(_own)
+            _adopt_orphans()
+        except Exception as e:
+            global _last_error
+            _last_error = str(e)[:500]
+
+
+def start_replayer():
+    global _thread
+    if _thread is not None:
+        return
+    _stopping.clear()
+    _thread = threading.Thread(target=_replay_loop, name="ingest-spool-replayer", daemon=True)
+    _thread.start()
+
+
+def stop_replayer():
+    global _thread
+    _stopping.set()
+    if _thread is not None:
+        _thread.join(timeout=5)
+        _thread = None
+
+
+def stats() -> Dict[str, Any]:
+    spool = _own
+    oldest = spool.oldest_spooled_at if spool is not None else None
+    if spool is not None and oldest is None and spool.has_backlog():
+        entry = spool.next_record()
+        oldest = entry[0].get("spooled_at") if entry else None
+    return {
+        "path": spool.path if spool is not None else None,
+        "spool_bytes": spool.size() if spool is not None else 0,
+        "pending_bytes": (spool.size() - spool.offset) if spool is not None else 0,
+        "pending_records": spool.pending_records if spool is not None else 0,
+        "replay_lag_seconds": round(time.time() - oldest.timestamp(), 3) if oldest else 0.0,
+        "replayed_records": _replayed_records,
+        "last_replay_at": _last_replay_at.isoformat() if _last_replay_at else None,
+        "last_error": _last_error,
+    }
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """In-memory database standing in for database.db"""
+    mongomock = pytest.importorskip("mongomock")
+    import database
+    test_db = mongomock.MongoClient().testdb
+    monkeypatch.setattr(database, "db", test_db)
+    return test_db
@@ -0,0 +1,91 @@
+import pytest
+from mongomock.collection import Collection
+
+from database import bulk_upsert_documents, upsert_document, MAX_DOCUMENT_BYTES, CREATED, UPDATED, UNCHANGED, FAILED
+
+
+@pytest.fixture
+def writes(db, monkeypatch):
+    """Number of ops in each bulk_write call"""
+    calls = []
+    original = Collection.bulk_write
+
+    def spy(self, requests, *args, **kwargs):
+        calls.append(len(requests))
+        return original(self, requests, *args, **kwargs)
+    monkeypatch.setattr(Collection, "bulk_write", spy)
+    return calls
+
+
+def doc(key, title, **fields):
+    return {"key": key, "title": title, "hash": f"{key}:{title}", **fields}
+
+
+def upsert(docs, **kwargs):
+    return bulk_upsert_documents("listing", "key", docs, fingerprint_field="hash", **kwargs)
+
+
+def test_created_then_updated(db):
+    [first] = upsert([doc("a", "one")])
+    assert first.status == CREATED
+    [second] = upsert([doc("a", "two")])
+    assert (second.status, second.id) == (UPDATED, first.id)
+    stored = db.listing.find_one()
+    assert str(stored["_id"]) == first.id
+    assert stored["title"] == "two"
+    assert stored["created_at"] <= stored["updated_at"]
+
+
+def test_unchanged_reingest_is_not_written(db, writes):
+    [first] = upsert([doc("a", "one")])
+    stored = db.listing.find_one()
+    writes.clear()
+    [again] = upsert([doc("a", "one")])
+    assert (again.status, again.id) == (UNCHANGED, first.id)
+    assert writes == []
+    assert db.listing.find_one()["updated_at"] == stored["updated_at"]
+
+
+def test_repeated_key_is_one_write_with_aligned_ids(db, writes):
+    results = upsert([doc("a", "one"), doc("b", "other"), doc("a", "two")])
+    assert writes == [2]
+    assert [r.status for r in results] == [CREATED, CREATED, UPDATED]
+    assert results[0].id == results[2].id != results[1].id
+    assert db.listing.count_documents({}) == 2
+    assert db.listing.find_one({"key": "a"})["title"] == "two"
+
+
+def test_raced_insert_is_reported_as_updated_with_real_id(db):
+    [existing] = upsert([doc("a", "one")])
+    # a stale "definitely new" answer skips the lookup; the upsert then matches the stored document
+    [raced] = upsert([doc("a", "two")], new_keys={"a"})
+    assert (raced.status, raced.id) == (UPDATED, existing.id)
+    assert db.listing.count_documents({}) == 1
+    assert db.listing.find_one()["title"] == "two"
+
+
+def test_failed_op_fails_only_its_own_items(db):
+    db.listing.create_index("url", unique=True, sparse=True)
+    upsert([doc("a", "one", url="http://x/1")])
+    results = upsert([doc("b", "two", url="http://x/1"), doc("c", "three"), doc("b", "again", url="http://x/1")])
+    assert [r.status for r in results] == [FAILED, CREATED, FAILED]
+    assert "duplicate key" in results[0].error.lower()
+    assert results[0].id is None
+    assert db.listing.find_one({"key": "c"}) is not None
+    assert db.listing.find_one({"key": "b"}) is None
+
+
+def test_unencodable_and_oversized_items_fail_before_writing(db, writes):
+    results = upsert([doc("a", "one", blob=b"x" * (MAX_DOCUMENT_BYTES + 1)), doc("b", "two", bad=object()), doc("c", "three")])
+    assert [r.status for r in results] == [FAILED, FAILED, CREATED]
+    assert "too large" in results[0].error
+    assert "encode" in results[1].error
+    assert writes == [1]
+
+
+def test_upsert_document_statuses(db):
+    first = upsert_document("listing", {"key": "a"}, doc("a", "one"), fingerprint_field="hash")
+    same = upsert_document("listing", {"key": "a"}, doc("a", "one"), fingerprint_field="hash")
+    changed = upsert_document("listing", {"key": "a"}, doc("a", "two"), fingerprint_field="hash")
+    assert [r.status for r in (first, same, changed)] == [CREATED, UNCHANGED, UPDATED]
+    assert first.id == same.id == changed.id
@@ -0,0 +1,109 @@
+import pytest
+
+from extract import price, bedrooms, surface, extract_batch
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Appartement S+2 100 m2 800 DT", 800),
+    ("S+1 45 m2 650dt", 650),
+    ("S+2 100m2 950 DT par mois", 950),
+    ("Villa 350 000 DT", 350_000),
+    ("Terrain 1.200 DT le m²", 1200),
+    ("Loyer 1.200,500 dinars", 1200.5),
+    ("A vendre 350 mille", 350_000),
+    ("Prix 1,2 million", 1_200_000),
+    ("Prix 2 MDT", 2_000_000),
+    ("Maison 120k à négocier", 120_000),
+    ("شقة 250 ألف", 250_000),
+    ("prix: 900", 900),
+])
+def test_price(text, expected):
+    value, confidence, _ = price(text)
+    assert value == expected
+    assert 0 < confidence <= 1
+
+
+def test_price_currency():
+    assert price("Studio 500€ par mois")[2] == "EUR"
+    assert price("Studio 500 DT")[2] == "TND"
+    assert price("350 mille")[2] is None
+
+
+@pytest.mark.parametrize("text", ["S+2 100 m2", "Appartement au 3e étage", "prix: 10"])
+def test_no_price(text):
+    assert price(text) is None
+
+
+def test_price_disagreement_lowers_confidence():
+    assert price("800 DT, négociable à 750 DT")[1] < price("800 DT")[1]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Appartement S+3 Ennasr", 3),
+    ("s + 1 meublé", 1),
+    ("Maison 4 chambres", 4),
+    ("3 pièces lumineux", 2),
+    ("Studio centre ville", 0),
+])
+def test_bedrooms(text, expected):
+    assert bedrooms(text)[0] == expected
+
+
+def test_no_bedrooms():
+    assert bedrooms("Terrain agricole 2 hectares") is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("S+2 120 m²", 120),
+    ("S+2 100m2 950 DT", 100),
+    ("Terrain 1.500 m2", 1500),
+    ("85 mètres carrés", 85),
+    ("Bureau 60,5 m2", 60.5),
+])
+def test_surface(text, expected):
+    assert surface(text)[0] == expected
+
+
+def test_no_surface():
+    assert surface("S+2 au 2e étage") is None
+
+
+def test_extract_batch_keeps_source_fields():
+    docs = [{"title": "S+2 100 m2 800 DT", "price": 900}]
+    extract_batch(docs)
+    assert docs[0]["price"] == 900
+    assert docs[0]["bedrooms"] == 2
+    assert docs[0]["surface_m2"] == 100
+    assert set(docs[0]["extraction"]) == {"bedrooms", "surface_m2"}
+
+
+def test_extract_batch_drops_confidence_of_source_supplied_field():
+    docs = [{"title": "Appartement 900 DT", "price": 1000}]
+    extract_batch(docs)
+    assert docs[0]["price"] == 1000
+    assert docs[0]["extraction"] is None
+
+
+def test_extract_batch_replaces_previous_extraction():
+    docs = [{"title": "Appartement S+2 900 DT", "price": 900, "bedrooms": 3, "extraction": {"price": 0.9}}]
+    extract_batch(docs)
+    assert set(docs[0]["extraction"]) == {"price"}
+    assert docs[0]["bedrooms"] == 3
+
+
+def test_extract_batch_clears_value_no_longer_in_text():
+    docs = [{"title": "Appartement à louer", "price": 900, "extraction": {"price": 0.9}}]
+    extract_batch(docs)
+    assert docs[0]["price"] is None
+    assert docs[0]["extraction"] is None
+
+
+def test_reingest_with_source_price_clears_stored_extraction(db):
+    from ingest import ingest_batch
+    item = {"title": "Appartement 900 DT", "url": "http://example.tn/1"}
+    ingest_batch([item], "tayara")
+    assert db.listing.find_one()["extraction"] == {"price": pytest.approx(0.9, abs=0.1)}
+    ingest_batch([{**item, "price": 1000}], "tayara")
+    stored = db.listing.find_one()
+    assert stored["price"] == 1000
+    assert not stored["extraction"]
@@ -0,0 +1,114 @@
+from datetime import datetime
+from functools import cmp_to_key
+
+import pytest
+from bson import ObjectId
+
+from paging import after_filter, encode_cursor, decode_cursor, InvalidCursor
+
+NEWEST = [["posted_at", -1], ["created_at", -1], ["_id", -1]]
+PRICE_ASC = [["price_tnd", 1], ["created_at", -1], ["_id", -1]]
+
+
+def _bracket(value):
+    # MongoDB orders null/missing before numbers and dates
+    return (0, 0) if value is None else (1, value)
+
+
+def _compare(value, op, bound):
+    # range operators never match null/missing, and only compare within a type
+    if value is None or bound is None or type(value) is not type(bound):
+        return False
+    return value < bound if op == "$lt" else value > bound
+
+
+def matches(doc, query):
+    """Minimal evaluator for the operators after_filter produces"""
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in cond):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, q) for q in cond):
+                return False
+        elif isinstance(cond, dict):
+            (op, bound), = cond.items()
+            value = doc.get(key)
+            if op == "$ne":
+                if value == bound:
+                    return False
+            elif op == "$in":
+                if value not in bound:
+                    return False
+            elif not _compare(value, op, bound):
+                return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+
+def sort_docs(docs, sort_order):
+    def cmp(a, b):
+        for field, direction in sort_order:
+            x, y = _bracket(a.get(field)), _bracket(b.get(field))
+            if x != y:
+                return (-1 if x < y else 1) * direction
+        return 0
+    return sorted(docs, key=cmp_to_key(cmp))
+
+
+def make_docs():
+    docs = []
+    for i in range(24):
+        docs.append({
+            "_id": ObjectId(),
+            "posted_at": None if i % 4 == 0 else datetime(2024, 1, 1 + i % 3),
+            "created_at": datetime(2024, 2, 1 + i % 2),
+            "price_tnd": None if i % 5 == 0 else float(100 * (i % 4)),
+        })
+    return docs
+
+
+@pytest.mark.parametrize("sort_order", [NEWEST, PRICE_ASC])
+def test_after_filter_resumes_exactly_after_each_position(sort_order):
+    ordered = sort_docs(make_docs(), sort_order)
+    for i, last in enumerate(ordered):
+        values = [last.get(field) for field, _ in sort_order]
+        query = after_filter(sort_order, values)
+        assert [d["_id"] for d in ordered if matches(d, query)] == [d["_id"] for d in ordered[i + 1:]]
+
+
+def test_null_descending_key_only_continues_among_nulls():
+    query = after_filter(NEWEST, [None, datetime(2024, 2, 1), ObjectId()])
+    # no range branch on posted_at: nulls sort last, nothing dated comes after
+    assert query["$or"][0]["$and"][0] == {"posted_at": None}
+    assert len(query["$or"]) == 1
+
+
+def test_dated_descending_key_includes_nulls():
+    query = after_filter(NEWEST, [datetime(2024, 1, 2), datetime(2024, 2, 1), ObjectId()])
+    assert {"posted_at": {"$lt": datetime(2024, 1, 2)}} in query["$or"]
+    assert {"posted_at": None} in query["$or"]
+
+
+def test_null_ascending_key_continues_with_all_values():
+    query = after_filter(PRICE_ASC, [None, datetime(2024, 2, 1), ObjectId()])
+    assert {"price_tnd": {"$ne": None}} in query["$or"]
+
+
+def test_after_filter_rejects_wrong_length():
+    with pytest.raises(InvalidCursor):
+        after_filter(NEWEST, [None])
+
+
+def test_cursor_round_trip():
+    doc = {"_id": ObjectId(), "posted_at": datetime(2024, 1, 1), "created_at": datetime(2024, 2, 1)}
+    sort, values = decode_cursor(encode_cursor("newest", NEWEST, doc))
+    assert sort == "newest"
+    assert values == [doc["posted_at"], doc["created_at"], doc["_id"]]
+
+
+@pytest.mark.parametrize("token", ["", "garbage!", "bm90IGJzb24"])
+def test_malformed_cursor(token):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(token)
@@ -0,0 +1,87 @@
+import asyncio
+import gzip
+import zlib
+
+import pytest
+from fastapi import HTTPException
+
+import payloads
+
+
+class FakeRequest:
+    def __init__(self, body: bytes, encoding: str = "", block_size: int = 16 * 1024):
+        self.headers = {"content-encoding": encoding}
+        self.blocks = [body[i:i + block_size] for i in range(0, len(body), block_size)]
+
+    async def stream(self):
+        for block in self.blocks:
+            yield block
+        yield b""
+
+
+def chunks(request):
+    async def collect():
+        return [chunk async for chunk in payloads.iter_body(request)]
+    return asyncio.run(collect())
+
+
+@pytest.fixture
+def small_cap(monkeypatch):
+    monkeypatch.setattr(payloads, "MAX_BODY_BYTES", 4 * payloads.CHUNK_BYTES)
+
+
+def zstd():
+    return pytest.importorskip("zstandard")
+
+
+BODY = b'{"items": [' + b",".join(b'{"title": "listing %d"}' % i for i in range(20000)) + b"]}"
+
+
+@pytest.mark.parametrize("encoding, compress", [
+    ("", lambda b: b),
+    ("gzip", gzip.compress),
+    ("deflate", zlib.compress),
+    ("zstd", lambda b: zstd().ZstdCompressor().compress(b)),
+])
+def test_round_trip(encoding, compress):
+    data = chunks(FakeRequest(compress(BODY), encoding))
+    assert b"".join(data) == BODY
+    assert max(map(len, data)) <= max(payloads.CHUNK_BYTES, 16 * 1024)
+
+
+@pytest.mark.parametrize("encoding, compress", [
+    ("gzip", gzip.compress),
+    ("zstd", lambda b: zstd().ZstdCompressor().compress(b)),
+])
+def test_bomb_stops_at_cap(small_cap, encoding, compress):
+    bomb = compress(bytes(64 * 1024 * 1024))
+    assert len(bomb) < 16 * 1024 * 1024
+    request = FakeRequest(bomb, encoding, block_size=len(bomb))
+    produced = []
+
+    async def collect():
+        async for chunk in payloads.iter_body(request):
+            produced.append(len(chunk))
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(collect())
+    assert e.value.status_code == 413
+    assert sum(produced) <= payloads.MAX_BODY_BYTES
+    assert all(n <= payloads.CHUNK_BYTES for n in produced)
+
+
+@pytest.mark.parametrize("encoding, body", [
+    ("gzip", b"\x1f\x8b\x08\x00garbage" * 10),
+    ("zstd", b"\x28\xb5\x2f\xfdgarbage" * 10),
+])
+def test_corrupt_body(encoding, body):
+    if encoding == "zstd":
+        zstd()
+    with pytest.raises(HTTPException) as e:
+        chunks(FakeRequest(body, encoding))
+    assert e.value.status_code == 400
+
+
+def test_unsupported_encoding():
+    with pytest.raises(HTTPException) as e:
+        chunks(FakeRequest(BODY, "br"))
+    assert e.value.status_code == 415
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import search_index
+from search_index import SearchIndex, Segment, build
+
+
+def listing(i, title, **fields):
+    return {"title": title, "description": "annonce " + "detail " * i, "city": "Tunis", "status": "approved",
+            "updated_at": datetime(2024, 1, 1) + timedelta(minutes=i), **fields}
+
+
+@pytest.fixture
+def index(db, tmp_path):
+    docs = [listing(i, "villa piscine jardin" if i % 2 else f"appartement lumineux {i}") for i in range(40)]
+    db.listing.insert_many(docs)
+    path = str(tmp_path / "listing.idx")
+    build(path)
+    index = SearchIndex(Segment(path))
+    yield index
+    index.base.close()
+
+
+def reindex(db, index, query):
+    docs = list(db.listing.find(query, search_index.PROJECTION))
+    for doc in docs:
+        doc["updated_at"] += timedelta(days=1)
+    return index.upsert(docs)
+
+
+def test_search_ranks_matching_listings(index):
+    ranked = index.search("villa")
+    assert len(ranked) == 20
+    assert all(score > 0 for _, score in ranked)
+
+
+def test_reindexing_keeps_scores_and_order(db, index):
+    before = index.search("villa piscine")
+    assert reindex(db, index, {"title": "villa piscine jardin"}) == 20
+    after = index.search("villa piscine")
+    assert [i for i, _ in after] == [i for i, _ in before]
+    assert [s for _, s in after] == pytest.approx([s for _, s in before])
+
+
+def test_reindexing_half_the_matches_keeps_scores(db, index):
+    before = dict(index.search("villa"))
+    ids = [doc["_id"] for doc in db.listing.find({"title": "villa piscine jardin"})][:10]
+    reindex(db, index, {"_id": {"$in": ids}})
+    assert dict(index.search("villa")) == pytest.approx(before)
+
+
+def test_changed_text_moves_listing_between_terms(db, index):
+    doc = db.listing.find_one({"title": "villa piscine jardin"})
+    index.upsert([{**doc, "title": "duplex terrasse", "updated_at": doc["updated_at"] + timedelta(days=1)}])
+    assert doc["_id"] not in dict(index.search("villa"))
+    assert [i for i, _ in index.search("duplex")] == [doc["_id"]]
+    assert len(index.search("villa")) == 19
+
+
+def test_facets_filter_after_reindex(db, index):
+    doc = db.listing.find_one({"title": "villa piscine jardin"})
+    index.upsert([{**doc, "status": "rejected", "updated_at": doc["updated_at"] + timedelta(days=1)}])
+    ranked = index.search("villa", exclude={"status": "rejected"})
+    assert doc["_id"] not in dict(ranked)
+    assert len(ranked) == 19
+    assert [i for i, _ in index.search("villa", facets={"status": "rejected"})] == [doc["_id"]]
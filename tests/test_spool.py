@@ -0,0 +1,66 @@
+import pytest
+from pymongo.errors import AutoReconnect
+
+import ingest
+import pricing
+import spool
+
+
+@pytest.fixture
+def own_spool(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(spool, "RECORD_DOCS", 2)
+    monkeypatch.setattr(spool, "_own", None)
+    yield
+    if spool._own is not None:
+        spool._own.close(remove=True)
+
+
+def item(n, price):
+    return {"title": f"Appartement S+{n} haut standing", "description": f"Résidence {n}, vue mer, parking",
+            "url": f"http://example.tn/{n}", "price": price}
+
+
+def fail_once(monkeypatch, module, name):
+    original = getattr(module, name)
+    calls = []
+
+    def flaky(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 2:
+            raise AutoReconnect("connection lost")
+        return original(*args, **kwargs)
+    monkeypatch.setattr(module, name, flaky)
+    return lambda: monkeypatch.setattr(module, name, original)
+
+
+def test_outage_spools_only_unwritten_slices(own_spool, monkeypatch):
+    restore = fail_once(monkeypatch, ingest, "bulk_upsert_documents")
+    result = ingest.ingest_batch([item(n, 800) for n in range(4)], "tayara")
+    restore()
+    assert result["created"] == 2
+    assert result["spooled"] == 2
+    assert result["statuses"] == ["created", "created", "spooled", "spooled"]
+    assert spool.has_backlog()
+
+
+def test_replay_finishes_post_write_steps(own_spool, db, monkeypatch):
+    ingest.ingest_batch([item(0, 800)], "tayara")
+    # the second slice is written, then the outage hits before its price change is recorded
+    restore = fail_once(monkeypatch, pricing, "record_changes")
+    result = ingest.ingest_batch([item(1, 800), item(2, 800), item(0, 900), item(3, 800)], "tayara")
+    restore()
+    assert result["statuses"] == ["created", "created", "spooled", "spooled"]
+    assert db.listing.count_documents({}) == 4
+    assert db.listing.count_documents({"cluster_id": {"$exists": True}}) == 3
+
+    assert spool.drain(spool._own)
+    assert not spool.has_backlog()
+    assert db.listing.count_documents({"cluster_id": {"$exists": False}}) == 0
+    listing = db.listing.find_one({"url": "http://example.tn/0"})
+    history = list(db[pricing.HISTORY_COLLECTION].find({"listing_id": listing["_id"]}))
+    assert [(h["old"], h["new"]) for h in history] == [(800, 900)]
+
+    # replaying again adds nothing
+    pricing.recover_changes([str(listing["_id"])])
+    assert db[pricing.HISTORY_COLLECTION].count_documents({}) == 1
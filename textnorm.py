@@ -0,0 +1,73 @@
+"""
+Text Normalization
+
+Accent-, case- and punctuation-insensitive folding shared by dedup,
+near-duplicate detection and search, plus an Arabic-to-Latin
+transliteration for script-insensitive keys (city_norm, area_norm) and a
+light Arabic stemmer for keyword search.
+"""
+
+import re
+import unicodedata
+from typing import List, Any
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def fold(text: Any) -> str:
+    """Casefold, strip accents/diacritics and collapse punctuation to single spaces"""
+    if text is None:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", str(text))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(_NON_WORD.sub(" ", stripped.casefold()).replace("_", " ").split())
+
+
+def tokens(text: Any) -> List[str]:
+    return fold(text).split()
+
+
+# Tunisian French-style romanization; short vowels are not written in Arabic
+_ARABIC_TO_LATIN = str.maketrans({
+    "ا": "a", "أ": "a", "إ": "i", "آ": "a", "ب": "b", "ت": "t", "ث": "th", "ج": "j",
+    "ح": "h", "خ": "kh", "د": "d", "ذ": "dh", "ر": "r", "ز": "z", "س": "s", "ش": "ch",
+    "ص": "s", "ض": "d", "ط": "t", "ظ": "dh", "ع": "a", "غ": "gh", "ف": "f", "ق": "k",
+    "ك": "k", "ل": "l", "م": "m", "ن": "n", "ه": "h", "ة": "a", "و": "ou", "ي": "i",
+    "ى": "a", "ء": "", "ئ": "i", "ؤ": "ou", "ـ": "",
+})
+
+
+def transliterate(text: Any) -> str:
+    """fold(), then romanize Arabic script so both scripts share one key space"""
+    words = []
+    for word in fold(text).split():
+        if word.startswith("ال") and len(word) > 3:
+            words.append("el")
+            word = word[2:]
+        words.append(word.translate(_ARABIC_TO_LATIN))
+    return " ".join(w for w in words if w)
+
+
+_ARABIC_LETTER = re.compile(r"[\u0621-\u064a]")
+# orthographic variants written interchangeably in listings
+_ARABIC_VARIANTS = str.maketrans({"ة": "ه", "ى": "ي", "أ": "ا", "إ": "ا", "آ": "ا", "ـ": ""})
+_ARABIC_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+_ARABIC_SUFFIXES = ("ات", "ون", "ين", "ها", "ه", "ي")
+
+
+def is_arabic(word: str) -> bool:
+    return bool(_ARABIC_LETTER.search(word))
+
+
+def arabic_stem(word: str) -> str:
+    """Light stemming: normalize letter variants, strip one article/conjunction prefix and one suffix"""
+    word = word.translate(_ARABIC_VARIANTS)
+    for prefix in _ARABIC_PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 2:
+            word = word[len(prefix):]
+            break
+    for suffix in _ARABIC_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            word = word[:-len(suffix)]
+            break
+    return word